@@ -0,0 +1,64 @@
+"""
+Async data access for the route handlers.
+
+sqlite3 and filesystem calls block, so the async handlers run them on a
+dedicated executor instead of on the event loop. Each executor thread keeps
+its own reused connection (see database.get_db).
+"""
+
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import List, Optional, Tuple
+
+from .config import DB_EXECUTOR_WORKERS
+from . import database as db
+
+_db_executor = ThreadPoolExecutor(max_workers=DB_EXECUTOR_WORKERS, thread_name_prefix="db")
+
+
+async def run_db(func, *args, **kwargs):
+    """Run a blocking database/filesystem call on the DB executor."""
+    return await asyncio.get_running_loop().run_in_executor(_db_executor, partial(func, *args, **kwargs))
+
+
+async def get_user_by_username(username: str) -> Optional[dict]:
+    return await run_db(db.get_user_by_username, username)
+
+
+async def create_user(username: str, password_hash: str) -> Optional[int]:
+    return await run_db(db.create_user, username, password_hash)
+
+
+async def create_video(video_id: str, user_id: int, prompt: str) -> int:
+    return await run_db(db.create_video, video_id, user_id, prompt)
+
+
+async def update_video_status(video_id: str, status: str, video_path: str = None):
+    return await run_db(db.update_video_status, video_id, status, video_path)
+
+
+async def get_video_by_id(video_id: str) -> Optional[dict]:
+    return await run_db(db.get_video_by_id, video_id)
+
+
+async def get_video_progress(video_id: str) -> Optional[dict]:
+    return await run_db(db.get_video_progress, video_id)
+
+
+async def get_trace_spans(video_id: str) -> List[dict]:
+    return await run_db(db.get_trace_spans, video_id)
+
+
+async def list_videos(limit: int, before: Optional[Tuple[str, int]] = None,
+                      user_id: Optional[int] = None, status: Optional[str] = None) -> List[dict]:
+    return await run_db(db.list_videos, limit, before, user_id=user_id, status=status)
+
+
+async def enqueue_job(video_id: str, payload: dict) -> int:
+    return await run_db(db.enqueue_job, video_id, payload)
+
+
+async def path_exists(path: str) -> bool:
+    return await run_db(os.path.exists, path)
@@ -1,18 +1,77 @@
 """Authentication utilities."""
 
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Any, Optional
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 
-from .config import SECRET_KEY, ALGORITHM, ACCESS_TOKEN_EXPIRE_MINUTES
+from .config import (
+    SECRET_KEY, ALGORITHM, ACCESS_TOKEN_EXPIRE_MINUTES,
+    AUTH_CACHE_TTL, AUTH_CACHE_SIZE, AUTH_HASH_WORKERS
+)
 from . import database as db
+from .async_db import run_db
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/token")
 
+# bcrypt is deliberately slow; run it here instead of on the event loop
+_hash_executor = ThreadPoolExecutor(max_workers=AUTH_HASH_WORKERS, thread_name_prefix="auth-hash")
+
+
+class TTLCache:
+    """Small thread-safe LRU cache whose entries also expire."""
+    
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Any, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key) -> Optional[Any]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+    
+    def set(self, key, value, ttl: Optional[float] = None):
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+    
+    def discard_where(self, predicate):
+        """Drop every entry whose value matches predicate."""
+        with self._lock:
+            for key in [k for k, (v, _) in self._data.items() if predicate(v)]:
+                del self._data[key]
+
+
+# token -> user claims, and username -> user row
+_token_cache = TTLCache(AUTH_CACHE_SIZE, AUTH_CACHE_TTL)
+_user_cache = TTLCache(AUTH_CACHE_SIZE, AUTH_CACHE_TTL)
+
+
+def invalidate_user(username: str):
+    """Forget cached tokens and rows for a user after it changes."""
+    _user_cache.discard_where(lambda user: user["username"] == username)
+    _token_cache.discard_where(lambda user: user["username"] == username)
+
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verify a password against its hash."""
@@ -24,6 +83,11 @@ def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
 
 
+async def get_password_hash_async(password: str) -> str:
+    """Hash a password on the bounded hashing executor."""
+    return await asyncio.get_running_loop().run_in_executor(_hash_executor, get_password_hash, password)
+
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     """Create a JWT access token."""
     to_encode = data.copy()
@@ -32,6 +96,16 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
 
+def get_user(username: str) -> Optional[dict]:
+    """Get a user row, served from the user cache when possible."""
+    user = _user_cache.get(username)
+    if user is None:
+        user = db.get_user_by_username(username)
+        if user is not None:
+            _user_cache.set(username, user)
+    return user
+
+
 def authenticate_user(username: str, password: str) -> Optional[dict]:
     """Authenticate a user."""
     user = db.get_user_by_username(username)
@@ -40,8 +114,19 @@ def authenticate_user(username: str, password: str) -> Optional[dict]:
     return user
 
 
+async def authenticate_user_async(username: str, password: str) -> Optional[dict]:
+    """Authenticate a user without blocking the event loop on bcrypt."""
+    return await asyncio.get_running_loop().run_in_executor(
+        _hash_executor, authenticate_user, username, password
+    )
+
+
 async def get_current_user(token: str = Depends(oauth2_scheme)) -> dict:
     """Get current user from JWT token."""
+    cached = _token_cache.get(token)
+    if cached is not None:
+        return cached
+    
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -55,7 +140,14 @@ async def get_current_user(token: str = Depends(oauth2_scheme)) -> dict:
     except JWTError:
         raise credentials_exception
     
-    user = db.get_user_by_username(username)
-    if user is None:
-        raise credentials_exception
+    if payload.get("uid") is not None:
+        # Tokens carry the user id, so the row lookup can be skipped
+        user = {"id": payload["uid"], "username": username}
+    else:
+        user = await run_db(get_user, username)
+        if user is None:
+            raise credentials_exception
+    
+    # Never cache a token past its own expiry
+    _token_cache.set(token, user, ttl=payload["exp"] - time.time() if "exp" in payload else None)
     return user
@@ -9,9 +9,17 @@ load_dotenv()
 # API Configuration
 BRIA_API_TOKEN = os.getenv("BRIA_API_TOKEN")
 BRIA_API_URL = "https://engine.prod.bria-api.com/v2/image/generate"
+BRIA_MAX_CONNECTIONS = int(os.getenv("BRIA_MAX_CONNECTIONS", "20"))
+BRIA_POLL_TIMEOUT = float(os.getenv("BRIA_POLL_TIMEOUT", "90"))
+BRIA_POLL_MAX_INTERVAL = float(os.getenv("BRIA_POLL_MAX_INTERVAL", "5"))
+# Submit all character prompt variants at once and keep the first success
+BRIA_RACE_PROMPTS = os.getenv("BRIA_RACE_PROMPTS", "false").lower() == "true"
 
 # Gemini Configuration
 GEMINI_MODEL = "gemini-2.0-flash"
+# "structured": plan characters, scenes and image prompts in one call
+# "chat": one chat round trip per step (also used as the structured fallback)
+GEMINI_PLANNING_MODE = os.getenv("GEMINI_PLANNING_MODE", "structured")
 
 # File paths
 BASE_DIR = Path(__file__).parent.parent
@@ -23,10 +31,102 @@ VIDEO_DIR = BASE_DIR / "videos"
 for directory in [AUDIO_DIR, OUTPUT_DIR, VIDEO_DIR]:
     directory.mkdir(parents=True, exist_ok=True)
 
+# External API rate limits (requests per second, and burst size). Set
+# RATE_LIMIT_SHARED=true to share the buckets between worker processes on a host.
+RATE_LIMIT_SHARED = os.getenv("RATE_LIMIT_SHARED", "false").lower() == "true"
+BRIA_RATE_PER_SEC = float(os.getenv("BRIA_RATE_PER_SEC", "2"))
+BRIA_BURST = float(os.getenv("BRIA_BURST", "5"))
+GEMINI_RATE_PER_SEC = float(os.getenv("GEMINI_RATE_PER_SEC", "2"))
+GEMINI_BURST = float(os.getenv("GEMINI_BURST", "5"))
+TTS_RATE_PER_SEC = float(os.getenv("TTS_RATE_PER_SEC", "3"))
+TTS_BURST = float(os.getenv("TTS_BURST", "5"))
+
+# Pipeline
+# Number of scenes whose TTS/Gemini/Bria work runs at the same time
+SCENE_CONCURRENCY = int(os.getenv("SCENE_CONCURRENCY", "3"))
+
+# Rendering
+# When enabled, each scene is encoded to its own segment as soon as it is ready
+# and the final video is a stream-copy concat of the segments.
+SEGMENTED_RENDER = os.getenv("SEGMENTED_RENDER", "true").lower() == "true"
+SEGMENT_ENCODE_WORKERS = int(os.getenv("SEGMENT_ENCODE_WORKERS", "2"))
+
+# Adaptive-bitrate HLS ladder packaged from the final MP4 (heights in pixels)
+HLS_ENABLED = os.getenv("HLS_ENABLED", "false").lower() == "true"
+HLS_RENDITIONS = [int(h) for h in os.getenv("HLS_RENDITIONS", "360,720,1080").split(",") if h.strip()]
+HLS_SEGMENT_SECONDS = int(os.getenv("HLS_SEGMENT_SECONDS", "4"))
+
+# Posters and per-scene preview strips ("webp" or "jpeg")
+THUMBNAIL_FORMAT = os.getenv("THUMBNAIL_FORMAT", "webp")
+THUMBNAIL_QUALITY = int(os.getenv("THUMBNAIL_QUALITY", "75"))
+POSTER_WIDTH = int(os.getenv("POSTER_WIDTH", "640"))
+STRIP_TILE_WIDTH = int(os.getenv("STRIP_TILE_WIDTH", "160"))
+
+# Video serving
+# "none": the app streams files itself
+# "x-accel": nginx serves them via X-Accel-Redirect to VIDEO_OFFLOAD_PREFIX (an internal location aliased to VIDEO_DIR)
+# "x-sendfile": Apache/lighttpd serve them via X-Sendfile
+VIDEO_OFFLOAD = os.getenv("VIDEO_OFFLOAD", "none")
+VIDEO_OFFLOAD_PREFIX = os.getenv("VIDEO_OFFLOAD_PREFIX", "/protected-videos/")
+
+# Caches
+# Generated Bria images, keyed by a hash of the normalized request payload
+IMAGE_CACHE_ENABLED = os.getenv("IMAGE_CACHE_ENABLED", "true").lower() == "true"
+IMAGE_CACHE_DIR = Path(os.getenv("IMAGE_CACHE_DIR", str(OUTPUT_DIR / "cache")))
+IMAGE_CACHE_MAX_BYTES = int(os.getenv("IMAGE_CACHE_MAX_BYTES", str(2 * 1024**3)))
+# Bria result URLs are temporary. A cached image whose URL is older than this
+# is regenerated when the URL is needed as an image-to-image reference.
+BRIA_URL_TTL = float(os.getenv("BRIA_URL_TTL", "3600"))
+
+# Narration clips, keyed by (engine, language, accent, text)
+TTS_LANGUAGE = os.getenv("TTS_LANGUAGE", "en")
+TTS_TLD = os.getenv("TTS_TLD", "com")
+TTS_CACHE_ENABLED = os.getenv("TTS_CACHE_ENABLED", "true").lower() == "true"
+TTS_CACHE_DIR = Path(os.getenv("TTS_CACHE_DIR", str(AUDIO_DIR / "cache")))
+TTS_CACHE_MAX_BYTES = int(os.getenv("TTS_CACHE_MAX_BYTES", str(512 * 1024**2)))
+
+# Gemini responses (stories and plans), keyed by (model, kind, normalized input).
+# Opt-in: a repeated prompt then reuses the earlier story and scene plan.
+GEMINI_CACHE_ENABLED = os.getenv("GEMINI_CACHE_ENABLED", "false").lower() == "true"
+GEMINI_CACHE_DIR = Path(os.getenv("GEMINI_CACHE_DIR", str(BASE_DIR / "cache" / "gemini")))
+GEMINI_CACHE_TTL = float(os.getenv("GEMINI_CACHE_TTL", str(7 * 24 * 3600)))
+GEMINI_CACHE_MAX_BYTES = int(os.getenv("GEMINI_CACHE_MAX_BYTES", str(64 * 1024**2)))
+
+# Jobs
+# "background": run generation inside the API process (FastAPI BackgroundTasks)
+# "queue": persist jobs in SQLite for standalone workers (python worker.py)
+JOB_BACKEND = os.getenv("JOB_BACKEND", "background")
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "120"))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "2"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+# Videos generated at once inside the API process in "background" mode
+PIPELINE_WORKERS = int(os.getenv("PIPELINE_WORKERS", "2"))
+
+# Progress reporting
+# Minimum seconds between progress writes to the database (stage changes always write)
+PROGRESS_WRITE_INTERVAL = float(os.getenv("PROGRESS_WRITE_INTERVAL", "1"))
+# How often the event stream re-reads the database, for jobs run by queue workers
+PROGRESS_POLL_INTERVAL = float(os.getenv("PROGRESS_POLL_INTERVAL", "2"))
+PROGRESS_KEEPALIVE = float(os.getenv("PROGRESS_KEEPALIVE", "15"))
+WEBHOOK_TIMEOUT = float(os.getenv("WEBHOOK_TIMEOUT", "10"))
+WEBHOOK_ATTEMPTS = int(os.getenv("WEBHOOK_ATTEMPTS", "3"))
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", "2"))
+# Webhooks only go to public addresses. Hosts listed here (comma-separated;
+# ".example.com" also matches subdomains) are allowed even if they resolve to
+# private addresses; when set, no other host is allowed at all.
+WEBHOOK_ALLOWED_HOSTS = [h.strip().lower() for h in os.getenv("WEBHOOK_ALLOWED_HOSTS", "").split(",") if h.strip()]
+
 # Database
-DB_PATH = BASE_DIR / "users.db"
+DB_PATH = Path(os.getenv("DB_PATH", str(BASE_DIR / "users.db")))
+# Threads the async routes use for blocking sqlite/filesystem calls
+DB_EXECUTOR_WORKERS = int(os.getenv("DB_EXECUTOR_WORKERS", "8"))
 
 # Auth
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-change-in-production")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60
+# Verified tokens and user rows are cached in-process for this many seconds
+AUTH_CACHE_TTL = float(os.getenv("AUTH_CACHE_TTL", "300"))
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", "10000"))
+# Threads available for bcrypt hashing/verification
+AUTH_HASH_WORKERS = int(os.getenv("AUTH_HASH_WORKERS", "4"))
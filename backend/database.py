@@ -1,18 +1,97 @@
 """Database models and connection."""
 
+import json
 import sqlite3
+import threading
+import time
 from datetime import datetime
-from typing import Optional, List
+from typing import Any, Dict, Optional, List, Tuple
 from .config import DB_PATH
 
 
+_local = threading.local()
+
+
 def get_db():
-    """Get database connection."""
-    conn = sqlite3.connect(str(DB_PATH))
-    conn.row_factory = sqlite3.Row
+    """
+    Get this thread's database connection.
+    
+    Connections are opened once per thread and reused, in WAL mode so
+    readers are not blocked by the pipeline's writes.
+    """
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(str(DB_PATH), timeout=30)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=5000")
+        conn.execute("PRAGMA cache_size=-16000")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        _local.conn = conn
     return conn
 
 
+def close_db():
+    """Close this thread's database connection, if any."""
+    conn = getattr(_local, "conn", None)
+    if conn is not None:
+        conn.close()
+        _local.conn = None
+
+
+# Schema changes applied after the base tables, tracked with PRAGMA user_version.
+# Append new steps; never edit or reorder existing ones.
+MIGRATIONS = [
+    "CREATE INDEX IF NOT EXISTS idx_videos_user_created ON videos (user_id, created_at)",
+    "CREATE INDEX IF NOT EXISTS idx_videos_status ON videos (status)",
+    "CREATE INDEX IF NOT EXISTS idx_videos_created ON videos (created_at)",
+    "CREATE INDEX IF NOT EXISTS idx_videos_status_created ON videos (status, created_at)",
+    "ALTER TABLE videos ADD COLUMN poster_path TEXT",
+    "ALTER TABLE videos ADD COLUMN strip_path TEXT",
+    "ALTER TABLE videos ADD COLUMN progress REAL DEFAULT 0",
+    "ALTER TABLE videos ADD COLUMN stage TEXT",
+    """CREATE TABLE IF NOT EXISTS trace_spans (
+        video_id TEXT NOT NULL,
+        trace_id TEXT NOT NULL,
+        span_id INTEGER NOT NULL,
+        parent_id INTEGER,
+        name TEXT NOT NULL,
+        thread TEXT,
+        start_time REAL NOT NULL,
+        end_time REAL,
+        status TEXT,
+        error TEXT,
+        attrs TEXT,
+        PRIMARY KEY (video_id, trace_id, span_id)
+    )""",
+]
+
+
+def migrate(conn: sqlite3.Connection):
+    """
+    Apply pending schema migrations.
+    
+    Several processes (API, workers) may start at once, so each step runs
+    under the write lock and re-reads user_version after taking it; the
+    statement and the version bump commit together.
+    """
+    while True:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            if version >= len(MIGRATIONS):
+                conn.commit()
+                return
+            conn.execute(MIGRATIONS[version])
+            conn.execute(f"PRAGMA user_version = {version + 1}")
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        print(f"[migrate] Applied migration {version + 1}")
+
+
 def init_db():
     """Initialize database tables."""
     conn = get_db()
@@ -41,8 +120,33 @@ def init_db():
         )
     """)
     
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            video_id TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            status TEXT DEFAULT 'queued',
+            attempts INTEGER DEFAULT 0,
+            worker_id TEXT,
+            lease_expires_at REAL,
+            error TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, id)")
+    
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS checkpoints (
+            video_id TEXT NOT NULL,
+            stage TEXT NOT NULL,
+            data TEXT NOT NULL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (video_id, stage)
+        )
+    """)
+    
     conn.commit()
-    conn.close()
+    migrate(conn)
 
 
 # User operations
@@ -50,17 +154,14 @@ def create_user(username: str, password_hash: str) -> Optional[int]:
     """Create a new user."""
     conn = get_db()
     try:
-        cursor = conn.cursor()
-        cursor.execute(
-            "INSERT INTO users (username, password_hash) VALUES (?, ?)",
-            (username, password_hash)
-        )
-        conn.commit()
+        with conn:
+            cursor = conn.execute(
+                "INSERT INTO users (username, password_hash) VALUES (?, ?)",
+                (username, password_hash)
+            )
         return cursor.lastrowid
     except sqlite3.IntegrityError:
         return None
-    finally:
-        conn.close()
 
 
 def get_user_by_username(username: str) -> Optional[dict]:
@@ -69,7 +170,6 @@ def get_user_by_username(username: str) -> Optional[dict]:
     cursor = conn.cursor()
     cursor.execute("SELECT * FROM users WHERE username = ?", (username,))
     row = cursor.fetchone()
-    conn.close()
     return dict(row) if row else None
 
 
@@ -77,33 +177,73 @@ def get_user_by_username(username: str) -> Optional[dict]:
 def create_video(video_id: str, user_id: int, prompt: str) -> int:
     """Create a new video record."""
     conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute(
-        "INSERT INTO videos (video_id, user_id, prompt, status, message) VALUES (?, ?, ?, ?, ?)",
-        (video_id, user_id, prompt, "processing", prompt[:100])
-    )
-    conn.commit()
+    with conn:
+        cursor = conn.execute(
+            "INSERT INTO videos (video_id, user_id, prompt, status, message) VALUES (?, ?, ?, ?, ?)",
+            (video_id, user_id, prompt, "processing", prompt[:100])
+        )
     video_db_id = cursor.lastrowid
-    conn.close()
     return video_db_id
 
 
 def update_video_status(video_id: str, status: str, video_path: str = None):
     """Update video status and path."""
     conn = get_db()
-    cursor = conn.cursor()
-    if video_path:
-        cursor.execute(
-            "UPDATE videos SET status = ?, video_path = ? WHERE video_id = ?",
-            (status, video_path, video_id)
+    with conn:
+        if video_path:
+            conn.execute(
+                "UPDATE videos SET status = ?, video_path = ? WHERE video_id = ?",
+                (status, video_path, video_id)
+            )
+        else:
+            conn.execute(
+                "UPDATE videos SET status = ? WHERE video_id = ?",
+                (status, video_id)
+            )
+
+
+def update_video_statuses(updates: List[Tuple[str, str, Optional[str]]]):
+    """Apply many (video_id, status, video_path) updates in one transaction."""
+    if not updates:
+        return
+    conn = get_db()
+    with conn:
+        conn.executemany(
+            "UPDATE videos SET status = ?, video_path = COALESCE(?, video_path) WHERE video_id = ?",
+            [(status, video_path, video_id) for video_id, status, video_path in updates]
         )
-    else:
-        cursor.execute(
-            "UPDATE videos SET status = ? WHERE video_id = ?",
-            (status, video_id)
+
+
+def update_video_progress(video_id: str, progress: float, stage: str):
+    """Record how far a video's generation has got."""
+    conn = get_db()
+    with conn:
+        conn.execute(
+            "UPDATE videos SET progress = ?, stage = ? WHERE video_id = ?",
+            (progress, stage, video_id)
+        )
+
+
+def get_video_progress(video_id: str) -> Optional[dict]:
+    """Get the status, progress and stage of a video."""
+    conn = get_db()
+    cursor = conn.cursor()
+    cursor.execute(
+        "SELECT video_id, status, progress, stage, video_path FROM videos WHERE video_id = ?",
+        (video_id,)
+    )
+    row = cursor.fetchone()
+    return dict(row) if row else None
+
+
+def update_video_thumbnails(video_id: str, poster_path: Optional[str], strip_path: Optional[str]):
+    """Record the poster and preview strip images of a video."""
+    conn = get_db()
+    with conn:
+        conn.execute(
+            "UPDATE videos SET poster_path = ?, strip_path = ? WHERE video_id = ?",
+            (poster_path, strip_path, video_id)
         )
-    conn.commit()
-    conn.close()
 
 
 def get_user_videos(user_id: int) -> List[dict]:
@@ -115,7 +255,6 @@ def get_user_videos(user_id: int) -> List[dict]:
         (user_id,)
     )
     rows = cursor.fetchall()
-    conn.close()
     return [dict(row) for row in rows]
 
 
@@ -125,7 +264,6 @@ def get_video_by_id(video_id: str) -> Optional[dict]:
     cursor = conn.cursor()
     cursor.execute("SELECT * FROM videos WHERE video_id = ?", (video_id,))
     row = cursor.fetchone()
-    conn.close()
     return dict(row) if row else None
 
 
@@ -135,9 +273,203 @@ def get_all_videos() -> List[dict]:
     cursor = conn.cursor()
     cursor.execute("SELECT * FROM videos ORDER BY created_at DESC")
     rows = cursor.fetchall()
-    conn.close()
     return [dict(row) for row in rows]
 
 
+def list_videos(limit: int, before: Optional[Tuple[str, int]] = None,
+                user_id: Optional[int] = None, status: Optional[str] = None) -> List[dict]:
+    """
+    Get one page of videos, newest first.
+    
+    Pages are keyed on (created_at, id): pass the last row's values as
+    `before` to get the next page. Uses the videos indexes, so cost depends
+    on the page size rather than on the total number of videos.
+    """
+    clauses, params = [], []
+    if user_id is not None:
+        clauses.append("user_id = ?")
+        params.append(user_id)
+    if status is not None:
+        clauses.append("status = ?")
+        params.append(status)
+    if before is not None:
+        clauses.append("(created_at, id) < (?, ?)")
+        params.extend(before)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    
+    conn = get_db()
+    cursor = conn.cursor()
+    cursor.execute(
+        "SELECT id, video_id, user_id, status, video_path, message, created_at, poster_path, strip_path, "
+        "progress, stage FROM videos "
+        f"{where} ORDER BY created_at DESC, id DESC LIMIT ?",
+        (*params, limit)
+    )
+    return [dict(row) for row in cursor.fetchall()]
+
+
+# Pipeline checkpoint operations
+def save_checkpoint(video_id: str, stage: str, data: Any):
+    """Persist the output of a pipeline stage for a video."""
+    conn = get_db()
+    with conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO checkpoints (video_id, stage, data) VALUES (?, ?, ?)",
+            (video_id, stage, json.dumps(data))
+        )
+
+
+def get_checkpoints(video_id: str) -> Dict[str, Any]:
+    """Get all saved stage outputs for a video, keyed by stage."""
+    conn = get_db()
+    cursor = conn.cursor()
+    cursor.execute("SELECT stage, data FROM checkpoints WHERE video_id = ?", (video_id,))
+    rows = cursor.fetchall()
+    return {row["stage"]: json.loads(row["data"]) for row in rows}
+
+
+def delete_checkpoints(video_id: str):
+    """Drop a video's checkpoints once it has completed."""
+    conn = get_db()
+    with conn:
+        conn.execute("DELETE FROM checkpoints WHERE video_id = ?", (video_id,))
+
+
+# Job queue operations
+def enqueue_job(video_id: str, payload: dict) -> int:
+    """Queue a video generation job for a worker."""
+    conn = get_db()
+    with conn:
+        cursor = conn.execute(
+            "INSERT INTO jobs (video_id, payload) VALUES (?, ?)",
+            (video_id, json.dumps(payload))
+        )
+    job_id = cursor.lastrowid
+    return job_id
+
+
+def claim_job(worker_id: str, lease_seconds: float) -> Optional[dict]:
+    """Atomically take the oldest queued job and lease it to worker_id."""
+    conn = get_db()
+    try:
+        # IMMEDIATE takes the write lock up front so two workers can't claim the same row
+        conn.execute("BEGIN IMMEDIATE")
+        row = conn.execute(
+            "SELECT * FROM jobs WHERE status = 'queued' ORDER BY id LIMIT 1"
+        ).fetchone()
+        if not row:
+            conn.commit()
+            return None
+        conn.execute(
+            "UPDATE jobs SET status = 'running', worker_id = ?, lease_expires_at = ?, "
+            "attempts = attempts + 1 WHERE id = ?",
+            (worker_id, time.time() + lease_seconds, row["id"])
+        )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    
+    job = dict(row)
+    job["payload"] = json.loads(job["payload"])
+    job.update(status="running", worker_id=worker_id, attempts=job["attempts"] + 1)
+    return job
+
+
+def heartbeat_job(job_id: int, worker_id: str, lease_seconds: float) -> bool:
+    """Extend a job lease. Returns False if the worker no longer owns the job."""
+    conn = get_db()
+    with conn:
+        cursor = conn.execute(
+            "UPDATE jobs SET lease_expires_at = ? WHERE id = ? AND worker_id = ? AND status = 'running'",
+            (time.time() + lease_seconds, job_id, worker_id)
+        )
+    owned = cursor.rowcount == 1
+    return owned
+
+
+def finish_job(job_id: int, worker_id: str, status: str, error: str = None):
+    """Mark a leased job completed or failed."""
+    conn = get_db()
+    with conn:
+        conn.execute(
+            "UPDATE jobs SET status = ?, error = ?, lease_expires_at = NULL "
+            "WHERE id = ? AND worker_id = ?",
+            (status, error, job_id, worker_id)
+        )
+
+
+def requeue_expired_jobs(max_attempts: int) -> int:
+    """Requeue running jobs whose lease ran out; give up after max_attempts."""
+    conn = get_db()
+    now = time.time()
+    with conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT video_id FROM jobs WHERE status = 'running' AND lease_expires_at < ? AND attempts >= ?",
+            (now, max_attempts)
+        )
+        exhausted = [row["video_id"] for row in cursor.fetchall()]
+        cursor.execute(
+            "UPDATE jobs SET status = 'failed', error = 'lease expired', worker_id = NULL "
+            "WHERE status = 'running' AND lease_expires_at < ? AND attempts >= ?",
+            (now, max_attempts)
+        )
+        cursor.execute(
+            "UPDATE jobs SET status = 'queued', worker_id = NULL, lease_expires_at = NULL "
+            "WHERE status = 'running' AND lease_expires_at < ?",
+            (now,)
+        )
+        requeued = cursor.rowcount
+    update_video_statuses([(video_id, "failed", None) for video_id in exhausted])
+    return requeued
+
+
+# Trace operations
+def save_trace_spans(video_id: str, trace_id: str, spans: List[dict]):
+    """Store the spans of one traced pipeline run."""
+    conn = get_db()
+    with conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO trace_spans (video_id, trace_id, span_id, parent_id, name, thread, "
+            "start_time, end_time, status, error, attrs) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [
+                (video_id, trace_id, s["span_id"], s["parent_id"], s["name"], s["thread"],
+                 s["start"], s["end"], s["status"], s["error"], json.dumps(s["attrs"], default=str))
+                for s in spans
+            ]
+        )
+
+
+def get_trace_spans(video_id: str) -> List[dict]:
+    """Get every stored span of a video, oldest first."""
+    conn = get_db()
+    cursor = conn.cursor()
+    cursor.execute(
+        "SELECT * FROM trace_spans WHERE video_id = ? ORDER BY start_time, span_id",
+        (video_id,)
+    )
+    spans = []
+    for row in cursor.fetchall():
+        span = dict(row)
+        span["start"] = span.pop("start_time")
+        span["end"] = span.pop("end_time")
+        span["attrs"] = json.loads(span["attrs"]) if span["attrs"] else {}
+        spans.append(span)
+    return spans
+
+
+def count_active_jobs() -> Dict[str, int]:
+    """Number of queued and running jobs."""
+    conn = get_db()
+    cursor = conn.cursor()
+    cursor.execute(
+        "SELECT status, COUNT(*) AS n FROM jobs WHERE status IN ('queued', 'running') GROUP BY status"
+    )
+    counts = {"queued": 0, "running": 0}
+    counts.update({row["status"]: row["n"] for row in cursor.fetchall()})
+    return counts
+
+
 # Initialize database on import
 init_db()
@@ -0,0 +1,299 @@
+"""
+Prometheus-style metrics.
+
+A small in-process registry rendered in the Prometheus text format at
+/metrics. Recording is a dict update under a lock, cheap enough to leave on
+in production. Values are per process: queue workers serve their own
+/metrics when started with `python worker.py --metrics-port PORT`.
+"""
+
+import threading
+import time
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Sequence, Tuple
+
+from . import tracing
+
+# Seconds; covers fast HTTP routes up to multi-minute pipeline stages
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+_registry: List["Metric"] = []
+_collectors: List[Callable[[], None]] = []
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _format_labels(pairs: Sequence[Tuple[str, str]]) -> str:
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Metric:
+    """Base class: a named family of values keyed by label values."""
+    
+    kind = "untyped"
+    
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, ...], object] = {}
+        _registry.append(self)
+    
+    def _key(self, labels: dict) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+    
+    def _samples(self, key: Tuple[str, ...], value) -> List[Tuple[str, List[Tuple[str, str]], float]]:
+        return [("", list(zip(self.labelnames, key)), value)]
+    
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+            items = [(key, value.copy() if isinstance(value, list) else value) for key, value in items]
+        for key, value in items:
+            for suffix, pairs, sample in self._samples(key, value):
+                lines.append(f"{self.name}{suffix}{_format_labels(pairs)} {_format_value(sample)}")
+        return lines
+
+
+class Counter(Metric):
+    """Monotonically increasing count."""
+    
+    kind = "counter"
+    
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    """Value that can go up and down."""
+    
+    kind = "gauge"
+    
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+    
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+    
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    """Distribution of observed values in cumulative buckets."""
+    
+    kind = "histogram"
+    
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+    
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            # Per-bucket counts, then sum and count
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+                    break
+            state[-2] += value
+            state[-1] += 1
+    
+    def time(self, **labels) -> "Timer":
+        """
+        Context manager/decorator observing elapsed seconds.
+        
+        If the histogram has an "outcome" label it is filled in with "ok" or
+        "error" depending on whether the block raised.
+        """
+        return Timer(self, labels)
+    
+    def totals(self) -> Dict[Tuple[str, ...], Tuple[int, float]]:
+        """(count, sum) of observations for each label combination."""
+        with self._lock:
+            return {key: (state[-1], state[-2]) for key, state in self._values.items()}
+    
+    def _samples(self, key, state):
+        pairs = list(zip(self.labelnames, key))
+        samples = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, state):
+            cumulative += count
+            samples.append(("_bucket", pairs + [("le", _format_value(bound))], cumulative))
+        samples.append(("_bucket", pairs + [("le", "+Inf")], state[-1]))
+        samples.append(("_sum", pairs, state[-2]))
+        samples.append(("_count", pairs, state[-1]))
+        return samples
+
+
+class Timer:
+    """
+    Times a block or function into a histogram (see Histogram.time).
+    
+    Inside a video trace the block is also recorded as a span named after
+    the label values, e.g. "bria.submit" or "render_scenes".
+    """
+    
+    def __init__(self, histogram: Histogram, labels: dict):
+        self.histogram = histogram
+        self.labels = labels
+    
+    def __enter__(self):
+        self._span = tracing.start_span(".".join(str(v) for v in self.labels.values()))
+        self._start = time.perf_counter()
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self._start
+        tracing.end_span(self._span, exc)
+        labels = dict(self.labels)
+        if "outcome" in self.histogram.labelnames and "outcome" not in labels:
+            labels["outcome"] = "error" if exc_type else "ok"
+        self.histogram.observe(elapsed, **labels)
+        return False
+    
+    def __call__(self, func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with Timer(self.histogram, self.labels):
+                return func(*args, **kwargs)
+        return wrapper
+
+
+def register_collector(collect: Callable[[], None]):
+    """Run collect() before every scrape, e.g. to refresh gauges from the database."""
+    _collectors.append(collect)
+
+
+def render() -> str:
+    """All metrics in the Prometheus text exposition format (version 0.0.4)."""
+    for collect in _collectors:
+        try:
+            collect()
+        except Exception as e:
+            print(f"[metrics] Collector failed: {e}")
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+# Pipeline
+STAGE_SECONDS = Histogram(
+    "stilltale_pipeline_stage_seconds", "Time spent in each pipeline stage", ["stage", "outcome"]
+)
+JOBS_IN_FLIGHT = Gauge("stilltale_jobs_in_flight", "Videos currently being generated by this process")
+JOBS = Gauge("stilltale_jobs", "Queued jobs by status", ["status"])
+JOBS_FINISHED = Counter("stilltale_jobs_finished_total", "Finished video generations", ["status"])
+
+# External providers and media tools
+PROVIDER_SECONDS = Histogram(
+    "stilltale_provider_request_seconds", "Latency of external provider calls",
+    ["provider", "operation", "outcome"]
+)
+MEDIA_SECONDS = Histogram(
+    "stilltale_media_command_seconds", "Time spent in ffmpeg/OpenCV operations", ["operation", "outcome"]
+)
+RETRIES = Counter("stilltale_retries_total", "Retried external calls", ["provider", "operation"])
+FALLBACKS = Counter("stilltale_fallbacks_total", "Fallbacks to a slower or simpler path", ["kind"])
+BRIA_POLLS = Counter("stilltale_bria_poll_requests_total", "Bria status polls", ["status"])
+
+# Caches
+CACHE_REQUESTS = Counter("stilltale_cache_requests_total", "Cache lookups", ["cache", "result"])
+CACHE_SIZE = Gauge("stilltale_cache_size_bytes", "Bytes stored in each cache", ["cache"])
+
+# HTTP
+HTTP_SECONDS = Histogram(
+    "stilltale_http_request_seconds", "Time to response headers for each route",
+    ["method", "route", "status"]
+)
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording HTTP latency per route template.
+    
+    Latency is measured to the response start so long-lived streams (video
+    downloads, progress events) don't skew it. Unmatched paths share one
+    label to keep cardinality bounded.
+    """
+    
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        
+        start = time.perf_counter()
+        recorded = False
+        
+        def record(status):
+            nonlocal recorded
+            if recorded:
+                return
+            recorded = True
+            route = scope.get("route")
+            HTTP_SECONDS.observe(
+                time.perf_counter() - start,
+                method=scope["method"],
+                route=getattr(route, "path", "unmatched"),
+                status=status
+            )
+        
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                record(message["status"])
+            await send(message)
+        
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except Exception:
+            record(500)
+            raise
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def log_message(self, format, *args):
+        pass
+
+
+def start_http_server(port: int, host: str = "0.0.0.0"):
+    """Serve /metrics from a background thread (for processes without the API)."""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    print(f"[metrics] Serving on {host}:{port}")
+    return server
@@ -0,0 +1,177 @@
+"""
+Job progress reporting.
+
+The pipeline's progress_callback is a ProgressReporter: it persists progress
+to the videos table (throttled) and pushes every update to subscribers in
+this process through the broker. Subscribers in other processes, e.g. when
+queue workers run the job, fall back to reading the database.
+
+Completion webhooks are sent from their own small executor so a slow or
+dead endpoint never holds a pipeline worker.
+"""
+
+import asyncio
+import ipaddress
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+import httpx
+
+from .config import (
+    PROGRESS_WRITE_INTERVAL, WEBHOOK_TIMEOUT, WEBHOOK_ATTEMPTS, WEBHOOK_WORKERS, WEBHOOK_ALLOWED_HOSTS
+)
+from . import database as db
+
+_webhook_executor = ThreadPoolExecutor(max_workers=WEBHOOK_WORKERS, thread_name_prefix="webhook")
+
+
+class ProgressBroker:
+    """In-process fan-out of progress events to asyncio subscribers."""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers: Dict[str, List[Tuple[asyncio.AbstractEventLoop, asyncio.Queue]]] = {}
+    
+    def subscribe(self, video_id: str) -> asyncio.Queue:
+        """Return a queue receiving the events of video_id (call from the event loop)."""
+        queue = asyncio.Queue()
+        with self._lock:
+            self._subscribers.setdefault(video_id, []).append((asyncio.get_running_loop(), queue))
+        return queue
+    
+    def unsubscribe(self, video_id: str, queue: asyncio.Queue):
+        with self._lock:
+            subscribers = [s for s in self._subscribers.get(video_id, []) if s[1] is not queue]
+            if subscribers:
+                self._subscribers[video_id] = subscribers
+            else:
+                self._subscribers.pop(video_id, None)
+    
+    def publish(self, video_id: str, event: dict):
+        """Deliver event to every subscriber of video_id; safe to call from any thread."""
+        with self._lock:
+            subscribers = list(self._subscribers.get(video_id, []))
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, event)
+            except RuntimeError:
+                # The subscriber's loop has shut down
+                self.unsubscribe(video_id, queue)
+
+
+broker = ProgressBroker()
+
+
+class ProgressReporter:
+    """
+    progress_callback for one video.
+    
+    Every update is published to the broker; database writes are limited to
+    one per PROGRESS_WRITE_INTERVAL, except that a new stage and the final
+    state are always written.
+    """
+    
+    def __init__(self, video_id: str, webhook_url: Optional[str] = None):
+        self.video_id = video_id
+        self.webhook_url = webhook_url
+        self._lock = threading.Lock()
+        self._last_write = 0.0
+        self._last_stage = None
+        self._pending = None
+    
+    def __call__(self, progress: float, stage: str):
+        broker.publish(self.video_id, {
+            "video_id": self.video_id, "status": "processing", "progress": progress, "stage": stage
+        })
+        with self._lock:
+            now = time.monotonic()
+            throttled = now - self._last_write < PROGRESS_WRITE_INTERVAL
+            if throttled and stage == self._last_stage and progress < 1.0:
+                self._pending = (progress, stage)
+                return
+            self._last_write = now
+            self._last_stage = stage
+            self._pending = None
+        try:
+            db.update_video_progress(self.video_id, progress, stage)
+        except Exception as e:
+            print(f"[ProgressReporter] Failed to save progress for {self.video_id}: {e}")
+    
+    def flush(self):
+        """Write the latest throttled update, if any."""
+        with self._lock:
+            pending, self._pending = self._pending, None
+        if pending:
+            db.update_video_progress(self.video_id, *pending)
+    
+    def finish(self, status: str, video_path: Optional[str] = None):
+        """Publish the final status and call the completion webhook."""
+        try:
+            self.flush()
+        except Exception as e:
+            print(f"[ProgressReporter] Failed to save progress for {self.video_id}: {e}")
+        event = {"video_id": self.video_id, "status": status, "video_path": video_path}
+        broker.publish(self.video_id, event)
+        if self.webhook_url:
+            _webhook_executor.submit(notify_webhook, self.webhook_url, event)
+
+
+def _host_allowed(host: str) -> bool:
+    return any(host == h or (h.startswith(".") and host.endswith(h)) for h in WEBHOOK_ALLOWED_HOSTS)
+
+
+def validate_webhook_url(url: str):
+    """
+    Raise ValueError unless url is an http(s) URL the server may call.
+    
+    Without WEBHOOK_ALLOWED_HOSTS, every address the host resolves to must be
+    public, which keeps users from reaching loopback, private networks or
+    cloud metadata endpoints through the server.
+    """
+    parts = urlsplit(url)
+    host = (parts.hostname or "").lower()
+    if parts.scheme not in ("http", "https") or not host:
+        raise ValueError("Webhook URL must be an http(s) URL with a host")
+    if WEBHOOK_ALLOWED_HOSTS:
+        if not _host_allowed(host):
+            raise ValueError(f"Webhook host {host} is not allowed")
+        return
+    
+    try:
+        infos = socket.getaddrinfo(host, parts.port or (443 if parts.scheme == "https" else 80),
+                                   type=socket.SOCK_STREAM)
+    except socket.gaierror as e:
+        raise ValueError(f"Webhook host {host} does not resolve: {e}")
+    for info in infos:
+        address = ipaddress.ip_address(info[4][0].split("%", 1)[0])
+        if isinstance(address, ipaddress.IPv6Address) and address.ipv4_mapped:
+            address = address.ipv4_mapped
+        if not address.is_global or address.is_multicast:
+            raise ValueError(f"Webhook host {host} resolves to a non-public address")
+
+
+def notify_webhook(url: str, payload: dict) -> bool:
+    """POST payload as JSON to url, retrying with backoff. Returns True once delivered."""
+    # Checked again at send time: the job may come from an older checkpoint,
+    # or DNS may have changed since the request was accepted
+    try:
+        validate_webhook_url(url)
+    except ValueError as e:
+        print(f"[notify_webhook] Refusing {url}: {e}")
+        return False
+    for attempt in range(WEBHOOK_ATTEMPTS):
+        try:
+            response = httpx.post(url, json=payload, timeout=WEBHOOK_TIMEOUT)
+            if response.status_code < 400:
+                print(f"[notify_webhook] Delivered {payload['status']} for {payload['video_id']}")
+                return True
+            print(f"[notify_webhook] {url} returned {response.status_code}")
+        except Exception as e:
+            print(f"[notify_webhook] {url} failed: {e}")
+        if attempt < WEBHOOK_ATTEMPTS - 1:
+            time.sleep(2 ** attempt)
+    return False
@@ -4,8 +4,11 @@ from fastapi import APIRouter, HTTPException, status, Depends
 from fastapi.security import OAuth2PasswordRequestForm
 from pydantic import BaseModel
 
-from ..auth import authenticate_user, create_access_token, get_password_hash, get_current_user
-from .. import database as db
+from ..auth import (
+    authenticate_user_async, create_access_token, get_password_hash_async, get_current_user,
+    invalidate_user
+)
+from .. import async_db as db
 
 router = APIRouter(prefix="/auth", tags=["auth"])
 
@@ -18,7 +21,7 @@ class Token(BaseModel):
 @router.post("/token", response_model=Token)
 async def login(form_data: OAuth2PasswordRequestForm = Depends()):
     """Login and get access token."""
-    user = authenticate_user(form_data.username, form_data.password)
+    user = await authenticate_user_async(form_data.username, form_data.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -26,22 +29,23 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends()):
             headers={"WWW-Authenticate": "Bearer"},
         )
     
-    access_token = create_access_token(data={"sub": user["username"]})
+    access_token = create_access_token(data={"sub": user["username"], "uid": user["id"]})
     return {"access_token": access_token, "token_type": "bearer"}
 
 
 @router.post("/register", response_model=Token)
 async def register(form_data: OAuth2PasswordRequestForm = Depends()):
     """Register a new user."""
-    existing_user = db.get_user_by_username(form_data.username)
+    existing_user = await db.get_user_by_username(form_data.username)
     if existing_user:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Username already registered"
         )
     
-    password_hash = get_password_hash(form_data.password)
-    user_id = db.create_user(form_data.username, password_hash)
+    password_hash = await get_password_hash_async(form_data.password)
+    user_id = await db.create_user(form_data.username, password_hash)
+    invalidate_user(form_data.username)
     
     if not user_id:
         raise HTTPException(
@@ -49,7 +53,7 @@ async def register(form_data: OAuth2PasswordRequestForm = Depends()):
             detail="Failed to create user"
         )
     
-    access_token = create_access_token(data={"sub": form_data.username})
+    access_token = create_access_token(data={"sub": form_data.username, "uid": user_id})
     return {"access_token": access_token, "token_type": "bearer"}
 
 
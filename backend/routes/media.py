@@ -0,0 +1,130 @@
+"""Media serving - conditional, byte-range and proxy-offloaded file responses."""
+
+import os
+from email.utils import formatdate, parsedate_to_datetime
+from pathlib import Path
+from typing import Iterator, Optional, Tuple
+
+from fastapi import HTTPException, Request, Response
+from fastapi.responses import FileResponse, StreamingResponse
+
+from ..async_db import run_db
+from ..config import VIDEO_DIR, VIDEO_OFFLOAD, VIDEO_OFFLOAD_PREFIX
+
+CHUNK_SIZE = 256 * 1024
+
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parse a single-range "bytes=" header into an inclusive (start, end).
+    
+    Returns None for headers we don't handle (multiple ranges, other units,
+    malformed specs), in which case the whole file is served. Raises 416 if
+    unsatisfiable.
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    start_text, _, end_text = spec.strip().partition("-")
+    try:
+        if start_text:
+            start = int(start_text)
+            end = int(end_text) if end_text else size - 1
+        else:
+            # Suffix range: the last N bytes
+            start = max(0, size - int(end_text))
+            end = size - 1
+    except ValueError:
+        return None
+    
+    if start >= size or start > end:
+        raise HTTPException(
+            status_code=416,
+            detail="Range not satisfiable",
+            headers={"Content-Range": f"bytes */{size}"}
+        )
+    return start, min(end, size - 1)
+
+
+def _read_range(path: str, start: int, end: int) -> Iterator[bytes]:
+    with open(path, "rb") as f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = f.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def _not_modified(request: Request, etag: str, mtime: float) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        return etag in [tag.strip() for tag in if_none_match.split(",")] or if_none_match.strip() == "*"
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return int(mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+async def serve_file(request: Request, path: str, media_type: str, filename: str = None,
+                     cache_control: str = "private, max-age=3600") -> Response:
+    """
+    Serve a file with ETag/Last-Modified validation and HTTP Range support.
+    
+    With VIDEO_OFFLOAD set, files under VIDEO_DIR are handed to the reverse
+    proxy (X-Accel-Redirect for nginx, X-Sendfile for Apache/lighttpd) and
+    the app only returns headers.
+    """
+    try:
+        stat = await run_db(os.stat, path)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="File not found")
+    
+    etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+    headers = {
+        "ETag": etag,
+        "Last-Modified": formatdate(stat.st_mtime, usegmt=True),
+        "Cache-Control": cache_control,
+        "Accept-Ranges": "bytes",
+    }
+    if filename:
+        headers["Content-Disposition"] = f'inline; filename="{filename}"'
+    
+    if _not_modified(request, etag, stat.st_mtime):
+        return Response(status_code=304, headers=headers)
+    
+    resolved = Path(path).resolve()
+    if VIDEO_OFFLOAD != "none" and resolved.is_relative_to(VIDEO_DIR.resolve()):
+        if VIDEO_OFFLOAD == "x-accel":
+            relative = resolved.relative_to(VIDEO_DIR.resolve()).as_posix()
+            headers["X-Accel-Redirect"] = VIDEO_OFFLOAD_PREFIX.rstrip("/") + "/" + relative
+        else:
+            headers["X-Sendfile"] = str(resolved)
+        return Response(media_type=media_type, headers=headers)
+    
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    byte_range = None
+    if range_header and (if_range is None or if_range == etag):
+        byte_range = parse_range(range_header, stat.st_size)
+    
+    if byte_range is None:
+        # FileResponse parses Range itself (multipart 206, 400 when malformed);
+        # hide the header so anything parse_range declined gets the whole file
+        request.scope["headers"] = [(k, v) for k, v in request.scope["headers"] if k != b"range"]
+        return FileResponse(path, media_type=media_type, headers=headers, stat_result=stat)
+    
+    start, end = byte_range
+    headers["Content-Range"] = f"bytes {start}-{end}/{stat.st_size}"
+    headers["Content-Length"] = str(end - start + 1)
+    return StreamingResponse(
+        _read_range(path, start, end),
+        status_code=206,
+        media_type=media_type,
+        headers=headers
+    )
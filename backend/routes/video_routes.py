@@ -1,21 +1,38 @@
 """Video generation routes."""
 
+import asyncio
+import base64
+import hashlib
+import json
 import os
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
-from fastapi.responses import FileResponse
-from pydantic import BaseModel
+import re
+import time
+from typing import List, Optional, Tuple
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import AnyHttpUrl, BaseModel
 
 from ..auth import get_current_user
-from .. import database as db
-from ..services.video_generator import generate_video_from_prompt
+from ..config import JOB_BACKEND, VIDEO_DIR, PROGRESS_POLL_INTERVAL, PROGRESS_KEEPALIVE
+from .. import async_db as db
+from ..progress import broker, validate_webhook_url
+from ..tracing import build_tree, to_chrome_trace
+from ..worker import run_in_process, get_resume_job
+from .media import serve_file
 
 router = APIRouter(tags=["videos"])
 
+MAX_PAGE_SIZE = 200
+
+# Files package_hls() writes: master/variant playlists and MPEG-TS segments
+HLS_FILE_PATTERN = re.compile(r"(master|stream_\d+)\.m3u8|stream_\d+_\d+\.ts")
+
 
 class VideoRequest(BaseModel):
     prompt: str
     is_story: bool = False  # If True, use prompt as full story instead of generating one
+    use_cache: bool = True  # If False, regenerate the story/plan even if a cached one exists
+    webhook_url: AnyHttpUrl | None = None  # POSTed {"video_id", "status", "video_path"} when the video completes or fails; public hosts only
 
 
 class VideoResponse(BaseModel):
@@ -24,35 +41,42 @@ class VideoResponse(BaseModel):
     message: str
     video_path: str | None = None
     created_at: str | None = None
+    poster_url: str | None = None
+    strip_url: str | None = None  # One STRIP_TILE_WIDTH-wide tile per scene, left to right
+    progress: float | None = None
+    stage: str | None = None
 
 
-def process_video_generation(video_id: str, prompt: str, is_story: bool = False):
-    """Background task to generate video."""
-    from ..services.video_generator import generate_video_from_prompt, generate_video_from_story
-    try:
-        if is_story:
-            video_path = generate_video_from_story(prompt, video_id)
-        else:
-            video_path = generate_video_from_prompt(prompt, video_id)
-        db.update_video_status(video_id, "completed", video_path)
-    except Exception as e:
-        print(f"[process_video_generation] Error: {e}")
-        db.update_video_status(video_id, "failed")
+async def dispatch_job(video_id: str, job: dict):
+    """Hand a generation job to the queue or to the in-process pipeline executor."""
+    if JOB_BACKEND == "queue":
+        await db.enqueue_job(video_id, job)
+    else:
+        run_in_process(video_id, job)
 
 
 @router.post("/generate-video", response_model=VideoResponse)
 async def generate_video(
     request: VideoRequest,
-    background_tasks: BackgroundTasks,
     current_user: dict = Depends(get_current_user)
 ):
     """Start video generation (async)."""
     import uuid
     video_id = str(uuid.uuid4())[:8]
     
-    db.create_video(video_id, current_user["id"], request.prompt)
+    if request.webhook_url:
+        # Resolves the host, so keep it off the event loop
+        try:
+            await db.run_db(validate_webhook_url, str(request.webhook_url))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
     
-    background_tasks.add_task(process_video_generation, video_id, request.prompt, request.is_story)
+    await db.create_video(video_id, current_user["id"], request.prompt)
+    
+    job = {"prompt": request.prompt, "is_story": request.is_story, "use_cache": request.use_cache}
+    if request.webhook_url:
+        job["webhook_url"] = str(request.webhook_url)
+    await dispatch_job(video_id, job)
     
     return VideoResponse(
         video_id=video_id,
@@ -61,26 +85,112 @@ async def generate_video(
     )
 
 
+@router.post("/video/{video_id}/resume", response_model=VideoResponse)
+async def resume_video(
+    video_id: str,
+    current_user: dict = Depends(get_current_user)
+):
+    """Retry a failed video, reusing every stage that already completed."""
+    video = await db.get_video_by_id(video_id)
+    
+    if not video:
+        raise HTTPException(status_code=404, detail="Video not found")
+    
+    if video["user_id"] != current_user["id"]:
+        raise HTTPException(status_code=403, detail="Access denied")
+    
+    if video["status"] != "failed":
+        raise HTTPException(status_code=409, detail="Only failed videos can be resumed")
+    
+    job = await db.run_db(get_resume_job, video_id)
+    if not job:
+        raise HTTPException(status_code=409, detail="No checkpoint to resume from")
+    
+    await db.update_video_status(video_id, "processing")
+    await dispatch_job(video_id, job)
+    
+    return VideoResponse(
+        video_id=video_id,
+        status="processing",
+        message=video["message"]
+    )
+
+
+def encode_cursor(video: dict) -> str:
+    """Opaque pagination cursor for the position after video."""
+    raw = f"{video['created_at']}|{video['id']}".encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> Tuple[str, int]:
+    """Inverse of encode_cursor."""
+    try:
+        created_at, row_id = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8").rsplit("|", 1)
+        return created_at, int(row_id)
+    except (ValueError, UnicodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def listing_etag(videos: List[dict], next_cursor: Optional[str]) -> str:
+    """ETag over exactly the fields a listing page serializes."""
+    digest = hashlib.sha1()
+    for v in videos:
+        digest.update(repr((
+            v["video_id"], v["status"], v["message"], v["video_path"], v["created_at"],
+            v["poster_path"], v["strip_path"], v["progress"], v["stage"]
+        )).encode())
+    digest.update(repr(next_cursor).encode())
+    return f'W/"{digest.hexdigest()}"'
+
+
 @router.get("/my-videos", response_model=List[VideoResponse])
-async def get_my_videos():
-    """Get all videos (public - visible to all users)."""
-    videos = db.get_all_videos()
+async def get_my_videos(
+    request: Request,
+    response: Response,
+    limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    owner_id: Optional[int] = None,
+    status: Optional[str] = None
+):
+    """
+    Get videos, newest first (public - visible to all users).
+    
+    Paginated: the X-Next-Cursor response header, when present, is the
+    `cursor` for the next page. Supports If-None-Match, returning 304 when
+    the page is unchanged.
+    """
+    before = decode_cursor(cursor) if cursor else None
+    videos = await db.list_videos(limit, before, user_id=owner_id, status=status)
+    next_cursor = encode_cursor(videos[-1]) if len(videos) == limit else None
+    
+    etag = listing_etag(videos, next_cursor)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if next_cursor:
+        headers["X-Next-Cursor"] = next_cursor
+    if etag in [tag.strip() for tag in request.headers.get("if-none-match", "").split(",")]:
+        return Response(status_code=304, headers=headers)
+    
+    response.headers.update(headers)
     return [
         VideoResponse(
             video_id=v["video_id"],
             status=v["status"],
             message=v["message"],
             video_path=v["video_path"],
-            created_at=str(v["created_at"])
+            created_at=str(v["created_at"]),
+            poster_url=f"/thumbnail/{v['video_id']}/poster" if v["poster_path"] else None,
+            strip_url=f"/thumbnail/{v['video_id']}/strip" if v["strip_path"] else None,
+            progress=v["progress"],
+            stage=v["stage"]
         )
         for v in videos
     ]
 
 
 @router.get("/video/{video_id}")
-async def get_video(video_id: str, current_user: dict = Depends(get_current_user)):
+async def get_video(video_id: str, request: Request, current_user: dict = Depends(get_current_user)):
     """Serve a video file (only to owner, requires auth header)."""
-    video = db.get_video_by_id(video_id)
+    video = await db.get_video_by_id(video_id)
     
     if not video:
         raise HTTPException(status_code=404, detail="Video not found")
@@ -92,10 +202,11 @@ async def get_video(video_id: str, current_user: dict = Depends(get_current_user
     if video["status"] != "completed" or not video["video_path"]:
         raise HTTPException(status_code=404, detail="Video not ready")
     
-    if not os.path.exists(video["video_path"]):
+    if not await db.path_exists(video["video_path"]):
         raise HTTPException(status_code=404, detail="Video file not found")
     
-    return FileResponse(
+    return await serve_file(
+        request,
         video["video_path"],
         media_type="video/mp4",
         filename=f"video_{video_id}.mp4"
@@ -103,9 +214,9 @@ async def get_video(video_id: str, current_user: dict = Depends(get_current_user
 
 
 @router.get("/public-video/{video_id}")
-async def get_video_with_token(video_id: str):
+async def get_video_with_token(video_id: str, request: Request):
     """Serve a video file (public access)."""
-    video = db.get_video_by_id(video_id)
+    video = await db.get_video_by_id(video_id)
     
     if not video:
         raise HTTPException(status_code=404, detail="Video not found")
@@ -116,12 +227,168 @@ async def get_video_with_token(video_id: str):
     video_path = video["video_path"]
     print(f"[get_video] Serving video: {video_path}")
     
-    if not os.path.exists(video_path):
+    if not await db.path_exists(video_path):
         print(f"[get_video] File not found: {video_path}")
         raise HTTPException(status_code=404, detail="Video file not found")
     
-    return FileResponse(
-        path=video_path,
+    return await serve_file(
+        request,
+        video_path,
         media_type="video/mp4",
-        filename=f"video_{video_id}.mp4"
+        filename=f"video_{video_id}.mp4",
+        cache_control="public, max-age=3600"
     )
+
+
+
+def format_event(state: dict) -> str:
+    """Server-Sent Events frame for a progress state."""
+    event = {k: state.get(k) for k in ("video_id", "status", "progress", "stage", "video_path")}
+    return f"data: {json.dumps(event)}\n\n"
+
+
+async def progress_events(request: Request, video_id: str, state: dict):
+    """
+    Yield a video's progress as SSE frames until it completes or fails.
+    
+    Updates published in this process arrive immediately through the broker;
+    the database is re-read every PROGRESS_POLL_INTERVAL for jobs running in
+    queue workers.
+    """
+    queue = broker.subscribe(video_id)
+    last = None
+    last_sent = time.monotonic()
+    try:
+        while True:
+            key = (state["status"], state.get("progress"), state.get("stage"))
+            # Throttled DB rows can lag behind pushed events; never report going backwards
+            behind = (
+                last is not None and key[0] == last[0] == "processing"
+                and (key[1] or 0) < (last[1] or 0)
+            )
+            if key != last and not behind:
+                yield format_event(state)
+                last = key
+                last_sent = time.monotonic()
+            if state["status"] in ("completed", "failed"):
+                return
+            
+            try:
+                state = await asyncio.wait_for(queue.get(), PROGRESS_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                if await request.is_disconnected():
+                    return
+                state = await db.get_video_progress(video_id) or state
+                if time.monotonic() - last_sent >= PROGRESS_KEEPALIVE:
+                    yield ": keepalive\n\n"
+                    last_sent = time.monotonic()
+    finally:
+        broker.unsubscribe(video_id, queue)
+
+
+@router.get("/video/{video_id}/events")
+async def get_video_events(video_id: str, request: Request):
+    """
+    Stream a video's progress as Server-Sent Events (public, like /my-videos).
+    
+    Each event is {"video_id", "status", "progress", "stage", "video_path"}; the stream
+    ends after the "completed" or "failed" event.
+    """
+    state = await db.get_video_progress(video_id)
+    if not state:
+        raise HTTPException(status_code=404, detail="Video not found")
+    
+    return StreamingResponse(
+        progress_events(request, video_id, state),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.get("/video/{video_id}/trace")
+async def get_video_trace(
+    video_id: str,
+    format: str = Query("json", pattern="^(json|chrome)$"),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Get the recorded span tree of every pipeline run of a video (owner only).
+    
+    format=chrome returns a Chrome trace / Perfetto JSON file instead.
+    Spans are saved when a run finishes, so a running video has none yet.
+    """
+    video = await db.get_video_by_id(video_id)
+    
+    if not video:
+        raise HTTPException(status_code=404, detail="Video not found")
+    
+    if video["user_id"] != current_user["id"]:
+        raise HTTPException(status_code=403, detail="Access denied")
+    
+    spans = await db.get_trace_spans(video_id)
+    if format == "chrome":
+        return JSONResponse(
+            to_chrome_trace(spans),
+            headers={"Content-Disposition": f'attachment; filename="trace_{video_id}.json"'}
+        )
+    return {"video_id": video_id, "spans": build_tree(spans)}
+
+
+THUMBNAIL_MEDIA_TYPES = {".webp": "image/webp", ".jpg": "image/jpeg", ".jpeg": "image/jpeg"}
+
+
+@router.get("/thumbnail/{video_id}/{kind}")
+async def get_thumbnail(video_id: str, kind: str, request: Request):
+    """Serve a video's poster or scene preview strip (public access)."""
+    if kind not in ("poster", "strip"):
+        raise HTTPException(status_code=404, detail="Thumbnail not found")
+    
+    video = await db.get_video_by_id(video_id)
+    path = video and video[f"{kind}_path"]
+    if not path:
+        raise HTTPException(status_code=404, detail="Thumbnail not found")
+    
+    return await serve_file(
+        request,
+        path,
+        media_type=THUMBNAIL_MEDIA_TYPES.get(os.path.splitext(path)[1], "application/octet-stream"),
+        cache_control="public, max-age=86400"
+    )
+
+
+async def serve_hls_file(request: Request, video: Optional[dict], video_id: str, filename: str,
+                         cache_control: str) -> Response:
+    """Serve one file of a completed video's HLS ladder."""
+    if not video:
+        raise HTTPException(status_code=404, detail="Video not found")
+    
+    if video["status"] != "completed":
+        raise HTTPException(status_code=404, detail="Video not ready")
+    
+    if not HLS_FILE_PATTERN.fullmatch(filename):
+        raise HTTPException(status_code=404, detail="File not found")
+    
+    path = str(VIDEO_DIR / f"hls_{video_id}" / filename)
+    if filename.endswith(".m3u8"):
+        media_type = "application/vnd.apple.mpegurl"
+    else:
+        media_type = "video/mp2t"
+    return await serve_file(request, path, media_type=media_type, cache_control=cache_control)
+
+
+@router.get("/video/{video_id}/hls/{filename}")
+async def get_video_hls(video_id: str, filename: str, request: Request,
+                        current_user: dict = Depends(get_current_user)):
+    """Serve the HLS playlists and segments of a video (owner only)."""
+    video = await db.get_video_by_id(video_id)
+    
+    if video and video["user_id"] != current_user["id"]:
+        raise HTTPException(status_code=403, detail="Access denied")
+    
+    return await serve_hls_file(request, video, video_id, filename, "private, max-age=3600")
+
+
+@router.get("/public-video/{video_id}/hls/{filename}")
+async def get_public_video_hls(video_id: str, filename: str, request: Request):
+    """Serve the HLS playlists and segments of a video (public access)."""
+    video = await db.get_video_by_id(video_id)
+    return await serve_hls_file(request, video, video_id, filename, "public, max-age=3600")
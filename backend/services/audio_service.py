@@ -1,42 +1,264 @@
 """Audio Service - Text-to-speech and audio processing."""
 
+import json
+import os
+import shutil
+import tempfile
+import threading
+from typing import Dict, List, Optional, Tuple
+
 from gtts import gTTS
-from pydub import AudioSegment
 
-from ..config import AUDIO_DIR
+from ..config import (
+    AUDIO_DIR, TTS_LANGUAGE, TTS_TLD, TTS_CACHE_ENABLED, TTS_CACHE_DIR, TTS_CACHE_MAX_BYTES
+)
+from ..metrics import PROVIDER_SECONDS, MEDIA_SECONDS
+from .disk_cache import DiskCache
+from .rate_limiter import get_limiter
+
+FALLBACK_NARRATION = "The scene continues."
+
+# MPEG audio Layer III tables, indexed by header fields
+_BITRATES_KBPS = {
+    1: [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    2: [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+_SAMPLE_RATES = {
+    1: [44100, 48000, 32000],
+    2: [22050, 24000, 16000],
+    2.5: [11025, 12000, 8000],
+}
+
+tts_cache = DiskCache(TTS_CACHE_DIR, TTS_CACHE_MAX_BYTES, suffix=".mp3", name="tts")
+
+# One lock per text being synthesized, so concurrent scenes asking for the
+# same narration wait for a single gTTS call instead of racing it.
+_inflight: Dict[str, threading.Lock] = {}
+_inflight_lock = threading.Lock()
+
+
+def _parse_frame_header(header: bytes) -> Optional[Tuple[int, int, int, bool]]:
+    """Parse an MP3 frame header into (frame_length, samples, sample_rate, mono)."""
+    if len(header) < 4 or header[0] != 0xFF or (header[1] & 0xE0) != 0xE0:
+        return None
+    
+    version = {0: 2.5, 2: 2, 3: 1}.get((header[1] >> 3) & 0x03)
+    layer_iii = ((header[1] >> 1) & 0x03) == 1
+    bitrate_index = header[2] >> 4
+    sample_rate_index = (header[2] >> 2) & 0x03
+    if version is None or not layer_iii or bitrate_index in (0, 15) or sample_rate_index == 3:
+        return None
+    
+    bitrate = _BITRATES_KBPS[1 if version == 1 else 2][bitrate_index] * 1000
+    sample_rate = _SAMPLE_RATES[version][sample_rate_index]
+    samples = 1152 if version == 1 else 576
+    padding = (header[2] >> 1) & 0x01
+    mono = (header[3] >> 6) == 3
+    return samples // 8 * bitrate // sample_rate + padding, samples, sample_rate, mono
+
+
+def _id3v2_size(data: bytes) -> int:
+    """Size of a leading ID3v2 tag, or 0."""
+    if len(data) < 10 or data[:3] != b"ID3":
+        return 0
+    size = (data[6] << 21) | (data[7] << 14) | (data[8] << 7) | data[9]
+    footer = 10 if data[5] & 0x10 else 0
+    return 10 + size + footer
+
+
+def _xing_frame_count(data: bytes, offset: int, mono: bool, mpeg1: bool) -> Optional[int]:
+    """Frame count from a Xing/Info header in the frame at offset, if present."""
+    side_info = (17 if mono else 32) if mpeg1 else (9 if mono else 17)
+    tag = offset + 4 + side_info
+    if data[tag:tag + 4] not in (b"Xing", b"Info"):
+        return None
+    flags = int.from_bytes(data[tag + 4:tag + 8], "big")
+    if not flags & 0x01:
+        return None
+    return int.from_bytes(data[tag + 8:tag + 12], "big")
+
+
+def _scan_mp3(path: str) -> Tuple[float, int, int]:
+    """
+    Walk MP3 frame headers without decoding any audio.
+    
+    Returns (duration_seconds, audio_start, audio_end), where the byte range
+    excludes ID3 tags and any Xing/Info header frame.
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    
+    start = _id3v2_size(data)
+    end = len(data) - 128 if data[-128:-125] == b"TAG" else len(data)
+    
+    # Resync to the first valid frame header
+    offset = start
+    while offset + 4 <= end and _parse_frame_header(data[offset:offset + 4]) is None:
+        offset += 1
+    header = _parse_frame_header(data[offset:offset + 4])
+    if header is None:
+        raise ValueError(f"No MP3 frames found in {path}")
+    
+    frame_length, samples, sample_rate, mono = header
+    frame_count = _xing_frame_count(data, offset, mono, samples == 1152)
+    if frame_count is not None:
+        # Xing/Info frame carries no audio; skip it so concatenation stays clean
+        return frame_count * samples / sample_rate, offset + frame_length, end
+    
+    audio_start = offset
+    total_samples = 0
+    while offset + 4 <= end:
+        header = _parse_frame_header(data[offset:offset + 4])
+        if header is None:
+            break
+        frame_length, samples, sample_rate, _ = header
+        total_samples += samples
+        offset += frame_length
+    return total_samples / sample_rate, audio_start, min(offset, end)
+
+
+def get_mp3_duration(path: str) -> float:
+    """Read an MP3's duration from its frame headers."""
+    return _scan_mp3(path)[0]
+
+
+def gtts_engine(text: str, output_path: str):
+    """Speak text into an MP3 at output_path with Google Translate TTS."""
+    gTTS(text, lang=TTS_LANGUAGE, tld=TTS_TLD).save(output_path)
+
+
+_tts_engine = gtts_engine
+# Part of the narration cache key, so clips from different engines never mix
+_tts_engine_name = "gtts"
+
+
+def set_tts_engine(engine, name: Optional[str] = None):
+    """
+    Replace the TTS engine (engine(text, output_path) writing an MP3), e.g. with a local stand-in.
+    
+    name identifies the engine in the narration cache; it defaults to the
+    engine's function or class name.
+    """
+    global _tts_engine, _tts_engine_name
+    _tts_engine = engine
+    _tts_engine_name = name or getattr(engine, "__name__", type(engine).__name__)
+
+
+def _synthesize(text: str, output_path: str) -> float:
+    """Run the TTS engine for text into output_path and return the clip duration."""
+    limiter = get_limiter("tts")
+    limiter.acquire()
+    try:
+        with PROVIDER_SECONDS.time(provider="tts", operation="synthesize"):
+            _tts_engine(text, output_path)
+    except Exception as e:
+        # gTTSError keeps the failed HTTP response as .rsp
+        limiter.report(getattr(getattr(e, "rsp", None), "status_code", None))
+        raise
+    limiter.report(200)
+    return get_mp3_duration(output_path)
+
+
+def _cached_duration(key: str, output_path: str) -> float:
+    """Duration stored with a cached clip, or read from the copied MP3 if its meta is gone."""
+    duration = tts_cache.get_meta(key).get("duration")
+    if duration is None:
+        # Meta lost to an eviction race or a partial write; the clip itself is fine
+        duration = get_mp3_duration(output_path)
+    return duration
+
+
+def synthesize_cached(text: str, output_path: str) -> float:
+    """Write narration audio for text to output_path, reusing cached clips. Returns duration."""
+    if not TTS_CACHE_ENABLED:
+        return _synthesize(text, output_path)
+    
+    key = DiskCache.make_key(_tts_engine_name, TTS_LANGUAGE, TTS_TLD, text)
+    if tts_cache.get_file(key, output_path):
+        return _cached_duration(key, output_path)
+    
+    with _inflight_lock:
+        key_lock = _inflight.setdefault(key, threading.Lock())
+    
+    with key_lock:
+        # Another thread may have synthesized it while we waited
+        if tts_cache.get_file(key, output_path):
+            return _cached_duration(key, output_path)
+        
+        fd, temp_path = tempfile.mkstemp(dir=AUDIO_DIR, suffix=".mp3")
+        os.close(fd)
+        try:
+            duration = _synthesize(text, temp_path)
+            tts_cache.put(key, src_path=temp_path, meta={"duration": duration})
+            shutil.move(temp_path, output_path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            with _inflight_lock:
+                _inflight.pop(key, None)
+    
+    return duration
+
+
+def _duration_path(index: int, video_id: str):
+    return AUDIO_DIR / f"audio_{video_id}_{index}.json"
 
 
 def text_to_audio(text: str, index: int, video_id: str) -> str:
     """Convert text to speech and save as audio file."""
-    audio_path = AUDIO_DIR / f"audio_{video_id}_{index}.flac"
+    audio_path = AUDIO_DIR / f"audio_{video_id}_{index}.mp3"
+    
+    if not (text and text.strip()):
+        text = FALLBACK_NARRATION
     
-    if text and text.strip():
-        tts = gTTS(text)
-    else:
-        tts = gTTS("The scene continues.")
+    duration = synthesize_cached(text, str(audio_path))
+    # Keep the duration next to the clip so get_audio_duration doesn't decode it
+    with open(_duration_path(index, video_id), "w") as f:
+        json.dump({"duration": duration}, f)
     
-    tts.save(str(audio_path))
     print(f"[text_to_audio] Saved: {audio_path}")
     return str(audio_path)
 
 
 def get_audio_duration(index: int, video_id: str) -> float:
     """Get duration of audio file in seconds."""
-    audio_path = AUDIO_DIR / f"audio_{video_id}_{index}.flac"
-    audio = AudioSegment.from_file(str(audio_path))
-    return len(audio) / 1000.0
+    try:
+        with open(_duration_path(index, video_id)) as f:
+            return json.load(f)["duration"]
+    except (FileNotFoundError, ValueError, KeyError):
+        pass
+    
+    return get_mp3_duration(str(AUDIO_DIR / f"audio_{video_id}_{index}.mp3"))
 
 
-def merge_audio_files(video_id: str, output_path: str):
-    """Merge all audio files for a video."""
-    audio_files = sorted(AUDIO_DIR.glob(f"audio_{video_id}_*.flac"))
+@MEDIA_SECONDS.time(operation="merge_audio_files")
+def merge_audio_files(video_id: str, output_path: str, audio_paths: List[str] = None):
+    """
+    Merge narration clips for a video into one MP3 without re-encoding.
+    
+    MP3 frames are self-contained, so the clips' frame data is streamed into
+    output_path back to back; the only transcode happens in the final mux.
+    """
+    if audio_paths is None:
+        audio_paths = sorted(
+            AUDIO_DIR.glob(f"audio_{video_id}_*.mp3"),
+            key=lambda p: int(p.stem.rsplit("_", 1)[1])
+        )
     
-    if not audio_files:
+    if not audio_paths:
         raise ValueError("No audio files found")
     
-    merged = AudioSegment.from_file(str(audio_files[0]))
-    for af in audio_files[1:]:
-        merged += AudioSegment.from_file(str(af))
+    with open(output_path, "wb") as out:
+        for audio_path in audio_paths:
+            _, start, end = _scan_mp3(str(audio_path))
+            with open(audio_path, "rb") as f:
+                f.seek(start)
+                remaining = end - start
+                while remaining > 0:
+                    chunk = f.read(min(remaining, 64 * 1024))
+                    if not chunk:
+                        break
+                    out.write(chunk)
+                    remaining -= len(chunk)
     
-    merged.export(output_path, format="mp3")
     print(f"[merge_audio_files] Created: {output_path}")
@@ -0,0 +1,224 @@
+"""Bria API Client - Async, connection-pooled HTTP client with adaptive polling."""
+
+import asyncio
+import os
+import tempfile
+import threading
+from typing import Iterator, Optional
+
+import httpx
+
+from ..config import (
+    BRIA_API_TOKEN, BRIA_API_URL, BRIA_MAX_CONNECTIONS,
+    BRIA_POLL_TIMEOUT, BRIA_POLL_MAX_INTERVAL
+)
+from .. import tracing
+from ..metrics import PROVIDER_SECONDS, RETRIES, BRIA_POLLS
+from .rate_limiter import get_limiter
+
+
+def poll_delays(max_interval: float = BRIA_POLL_MAX_INTERVAL) -> Iterator[float]:
+    """Yield polling delays: quick first checks, then back off to max_interval."""
+    delay = 0.5
+    while True:
+        yield delay
+        delay = min(delay * 1.5, max_interval)
+
+
+def extract_image_url(data: dict) -> Optional[str]:
+    """Pull the image URL out of a Bria submit or status response."""
+    result = data.get("result", {})
+    if isinstance(result, dict):
+        image_url = result.get("url") or result.get("image_url")
+    elif isinstance(result, list) and result:
+        image_url = result[0].get("url")
+    else:
+        image_url = None
+    
+    return (
+        image_url or
+        data.get("url") or
+        data.get("result_url") or
+        data.get("image_url")
+    )
+
+
+class BriaClient:
+    """Asyncio Bria client sharing one pooled keep-alive HTTP session."""
+    
+    def __init__(
+        self,
+        api_token: str = BRIA_API_TOKEN,
+        api_url: str = BRIA_API_URL,
+        max_connections: int = BRIA_MAX_CONNECTIONS,
+        poll_timeout: float = BRIA_POLL_TIMEOUT,
+        transport: Optional[httpx.AsyncBaseTransport] = None
+    ):
+        self.api_token = api_token
+        self.api_url = api_url
+        self.max_connections = max_connections
+        self.poll_timeout = poll_timeout
+        self.transport = transport
+        self._client: Optional[httpx.AsyncClient] = None
+    
+    @property
+    def session(self) -> httpx.AsyncClient:
+        """Lazily create the shared session on the running event loop."""
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                    keepalive_expiry=60
+                ),
+                timeout=httpx.Timeout(30.0),
+                transport=self.transport
+            )
+        return self._client
+    
+    @property
+    def auth_headers(self) -> dict:
+        """Headers for Bria API calls (not sent to image download hosts)."""
+        return {"api_token": self.api_token or ""}
+    
+    async def submit(self, payload: dict) -> dict:
+        """Submit a generation request, retrying transient failures."""
+        limiter = get_limiter("bria")
+        for attempt in range(3):
+            retry_after = attempt + 1
+            try:
+                await limiter.acquire_async()
+                with PROVIDER_SECONDS.time(provider="bria", operation="submit"):
+                    response = await self.session.post(
+                        self.api_url, json=payload, headers=self.auth_headers
+                    )
+                    tracing.annotate(attempt=attempt + 1, status_code=response.status_code)
+                    await limiter.report_async(response.status_code)
+                    if response.status_code == 429:
+                        try:
+                            retry_after = float(response.headers.get("Retry-After", retry_after))
+                        except ValueError:
+                            pass
+                    response.raise_for_status()
+                    return response.json()
+            except Exception as e:
+                if attempt == 2:
+                    raise
+                RETRIES.inc(provider="bria", operation="submit")
+                print(f"[BriaClient] Request failed, retrying in {retry_after:g}s: {e}")
+                await asyncio.sleep(retry_after)
+    
+    async def poll(self, status_url: str) -> dict:
+        """Poll status_url with adaptive backoff until the image is ready."""
+        with PROVIDER_SECONDS.time(provider="bria", operation="poll"):
+            return await self._poll(status_url)
+    
+    async def _poll(self, status_url: str) -> dict:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.poll_timeout
+        
+        for attempt, delay in enumerate(poll_delays(), start=1):
+            if loop.time() + delay > deadline:
+                break
+            await asyncio.sleep(delay)
+            
+            try:
+                with tracing.span("bria.poll_request", attempt=attempt, delay=delay):
+                    response = await self.session.get(status_url, headers=self.auth_headers)
+                    status_data = response.json()
+                    tracing.annotate(status=status_data.get("status"))
+            except Exception as e:
+                BRIA_POLLS.inc(status="error")
+                print(f"[BriaClient] Poll failed, retrying: {e}")
+                continue
+            
+            status = status_data.get("status", "").lower()
+            BRIA_POLLS.inc(status=status or "unknown")
+            print(f"[BriaClient] Status: {status}")
+            
+            if status in ("completed", "ready"):
+                image_url = extract_image_url(status_data)
+                if image_url:
+                    return {"url": image_url}
+                raise ValueError(f"Completed but no URL: {status_data}")
+            
+            elif status in ("failed", "error"):
+                raise ValueError(f"Image generation failed: {status_data}")
+        
+        raise TimeoutError(f"Image generation timed out after {self.poll_timeout:.0f} seconds")
+    
+    async def generate(self, payload: dict) -> dict:
+        """Submit a request and wait for its result URL."""
+        data = await self.submit(payload)
+        
+        image_url = extract_image_url(data)
+        if image_url:
+            return {**data, "url": image_url}
+        
+        status_url = data.get("status_url")
+        if not status_url:
+            raise ValueError(f"No status_url in response: {data}")
+        
+        print(f"[BriaClient] Polling status: {status_url}")
+        return await self.poll(status_url)
+    
+    async def download(self, url: str, output_path: str) -> str:
+        """Stream an image straight to disk, replacing output_path atomically."""
+        directory = os.path.dirname(os.path.abspath(output_path))
+        fd, temp_path = tempfile.mkstemp(dir=directory, suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as f, PROVIDER_SECONDS.time(provider="bria", operation="download"):
+                async with self.session.stream("GET", url) as response:
+                    response.raise_for_status()
+                    async for chunk in response.aiter_bytes(64 * 1024):
+                        f.write(chunk)
+            os.replace(temp_path, output_path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        return output_path
+    
+    async def aclose(self):
+        """Close the shared session."""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+# The shared client lives on a dedicated event loop so sync callers on any
+# thread reuse the same connection pool.
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_lock = threading.Lock()
+_client: Optional[BriaClient] = None
+
+
+def get_loop() -> asyncio.AbstractEventLoop:
+    """Get the background event loop that runs Bria requests."""
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="bria-client", daemon=True).start()
+    return _loop
+
+
+def get_client() -> BriaClient:
+    """Get the process-wide Bria client."""
+    global _client
+    with _loop_lock:
+        if _client is None:
+            _client = BriaClient()
+    return _client
+
+
+def set_client(client: BriaClient):
+    """Replace the process-wide Bria client, e.g. with one on a local transport."""
+    global _client
+    with _loop_lock:
+        _client = client
+
+
+def run_sync(coro):
+    """Run a coroutine on the Bria event loop and block until it finishes."""
+    return asyncio.run_coroutine_threadsafe(tracing.bind(coro), get_loop()).result()
@@ -1,11 +1,20 @@
 """Bria API Service - Image generation."""
 
+import asyncio
 import base64
+import os
 import time
-import requests
-from typing import Dict
+from functools import partial
+from typing import Dict, List, Optional, Union
 
-from ..config import BRIA_API_TOKEN, BRIA_API_URL, OUTPUT_DIR
+from ..config import (
+    OUTPUT_DIR, BRIA_RACE_PROMPTS, BRIA_URL_TTL, IMAGE_CACHE_ENABLED, IMAGE_CACHE_DIR, IMAGE_CACHE_MAX_BYTES
+)
+from ..metrics import FALLBACKS
+from .bria_client import get_client, run_sync
+from .disk_cache import DiskCache
+
+image_cache = DiskCache(IMAGE_CACHE_DIR, IMAGE_CACHE_MAX_BYTES, suffix=".png", name="image")
 
 
 def image_to_base64(image_path: str) -> str:
@@ -15,88 +24,83 @@ def image_to_base64(image_path: str) -> str:
 
 
 def save_image_from_url(url: str, output_path: str) -> str:
-    """Download image from URL and save locally."""
-    response = requests.get(url)
-    response.raise_for_status()
-    with open(output_path, "wb") as f:
-        f.write(response.content)
-    return output_path
+    """Download image from URL and stream it to disk."""
+    return run_sync(get_client().download(url, output_path))
 
 
 def call_bria_api(payload: dict) -> dict:
     """Call Bria API for image generation (async V2 - polls for result)."""
-    headers = {
-        "Content-Type": "application/json",
-        "api_token": BRIA_API_TOKEN
-    }
-    
-    time.sleep(3)
-    
-    for attempt in range(3):
-        try:
-            response = requests.post(BRIA_API_URL, json=payload, headers=headers, timeout=30)
-            response.raise_for_status()
-            break
-        except Exception as e:
-            if attempt == 2:
-                raise
-            print(f"[call_bria_api] Request failed, retrying in 5s: {e}")
-            time.sleep(5)
-    
-    data = response.json()
-    
-    if data.get("result", {}).get("url") or data.get("url"):
-        return data
-    
-    status_url = data.get("status_url")
-    if not status_url:
-        raise ValueError(f"No status_url in response: {data}")
-    
-    print(f"[call_bria_api] Polling status: {status_url}")
-    
-    for i in range(18):
-        time.sleep(7)
-        
-        try:
-            status_response = requests.get(status_url, headers={"api_token": BRIA_API_TOKEN}, timeout=30)
-            status_data = status_response.json()
-        except Exception as e:
-            print(f"[call_bria_api] Poll failed, retrying: {e}")
-            time.sleep(5)
-            continue
-        
-        status = status_data.get("status", "").lower()
-        print(f"[call_bria_api] Status: {status}")
-        
-        if status in ("completed", "ready"):
-            result = status_data.get("result", {})
-            if isinstance(result, dict):
-                image_url = result.get("url") or result.get("image_url")
-            else:
-                image_url = None
-            
-            if not image_url:
-                image_url = (
-                    status_data.get("url") or
-                    status_data.get("result_url") or
-                    status_data.get("image_url")
-                )
-            if image_url:
-                return {"url": image_url}
-            
-            results = status_data.get("result", [])
-            if isinstance(results, list) and results:
-                return {"url": results[0].get("url")}
-            raise ValueError(f"Completed but no URL: {status_data}")
-        
-        elif status in ("failed", "error"):
-            raise ValueError(f"Image generation failed: {status_data}")
-    
-    raise TimeoutError("Image generation timed out after 90 seconds")
+    return run_sync(get_client().generate(payload))
 
 
-def generate_character_image(name: str, description: str, video_id: str) -> dict:
-    """Generate a character reference image using Bria API."""
+def _cache_key(payload: dict) -> str:
+    """Cache key for a generation payload, ignoring whitespace differences in the prompt."""
+    normalized = dict(payload)
+    if isinstance(normalized.get("prompt"), str):
+        normalized["prompt"] = " ".join(normalized["prompt"].split())
+    return DiskCache.make_key("bria", normalized)
+
+
+def _cached_url(key: str, output_path: str, url_max_age: Optional[float]) -> Optional[str]:
+    """Copy a cached image to output_path and return its Bria URL, or None on a miss."""
+    if not image_cache.get_file(key, output_path):
+        return None
+    # The URL is needed as an image-to-image reference, so an entry without one is a miss
+    meta = image_cache.get_meta(key)
+    image_url = meta.get("url")
+    fresh = url_max_age is None or time.time() - meta.get("created_at", 0) <= url_max_age
+    return image_url if fresh else None
+
+
+async def generate_image_async(payload: dict, output_path: str, url_max_age: Optional[float] = None) -> str:
+    """
+    Generate an image for payload into output_path, returning its Bria URL.
+    
+    Identical payloads are served from the shared image cache without a
+    remote call. Pass url_max_age when the URL itself will be used (as an
+    image-to-image reference): entries whose URL is older count as misses,
+    since Bria result URLs expire. Cache reads and writes (file copies,
+    eviction) run on a thread so they don't stall the shared Bria loop.
+    """
+    loop = asyncio.get_running_loop()
+    key = _cache_key(payload)
+    if IMAGE_CACHE_ENABLED:
+        image_url = await loop.run_in_executor(None, _cached_url, key, output_path, url_max_age)
+        if image_url:
+            print(f"[generate_image] Cache hit: {output_path}")
+            return image_url
+    
+    client = get_client()
+    data = await client.generate(payload)
+    image_url = data.get("url")
+    
+    if not image_url:
+        raise ValueError(f"No image URL in response: {data}")
+    
+    await client.download(image_url, output_path)
+    if IMAGE_CACHE_ENABLED:
+        await loop.run_in_executor(
+            None, partial(image_cache.put, key, src_path=output_path, meta={"url": image_url})
+        )
+    return image_url
+
+
+def generate_image(payload: dict, output_path: str) -> str:
+    """Generate an image for payload into output_path, returning its Bria URL."""
+    return run_sync(generate_image_async(payload, output_path))
+
+
+async def generate_character_image_async(name: str, description: str, video_id: str,
+                                         race: bool = None) -> dict:
+    """
+    Generate a character reference image using Bria API.
+    
+    With race=True all prompt variants are submitted at once; the first
+    success wins and the remaining requests are cancelled. Otherwise the
+    variants are tried in order as fallbacks.
+    """
+    if race is None:
+        race = BRIA_RACE_PROMPTS
     print(f"[generate_character_image] Generating: {name}")
     
     safe_desc = description.replace("young", "").replace("girl", "person").replace("boy", "person")
@@ -107,19 +111,41 @@ def generate_character_image(name: str, description: str, video_id: str) -> dict
         f"Friendly cartoon character, {safe_desc}, illustration style"
     ]
     
-    output_path = str(OUTPUT_DIR / f"char_{name.lower().replace(' ', '_')}_{video_id}.png")
+    slug = name.lower().replace(' ', '_')
+    output_path = str(OUTPUT_DIR / f"char_{slug}_{video_id}.png")
+    
+    if race:
+        # Each variant downloads to its own file so a late loser can't
+        # overwrite the winner's portrait; only the winner is moved into place
+        variant_paths = [str(OUTPUT_DIR / f"char_{slug}_v{i}_{video_id}.png") for i in range(len(prompts))]
+        
+        async def variant(prompt: str, path: str):
+            return path, await generate_image_async({"prompt": prompt}, path, url_max_age=BRIA_URL_TTL)
+        
+        tasks = [asyncio.ensure_future(variant(prompt, path)) for prompt, path in zip(prompts, variant_paths)]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                try:
+                    winner_path, image_url = await next_done
+                except Exception as e:
+                    print(f"[generate_character_image] Variant failed: {e}")
+                    continue
+                os.replace(winner_path, output_path)
+                print(f"[generate_character_image] Saved: {output_path}")
+                return {"url": image_url, "local_path": output_path}
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            for path in variant_paths:
+                if os.path.exists(path):
+                    os.remove(path)
+        raise ValueError("All prompt attempts failed")
     
     for i, prompt in enumerate(prompts):
         try:
             print(f"[generate_character_image] Attempt {i+1}: {prompt[:50]}...")
-            payload = {"prompt": prompt}
-            data = call_bria_api(payload)
-            image_url = data.get("url")
-            
-            if not image_url:
-                raise ValueError(f"No image URL in response: {data}")
-            
-            save_image_from_url(image_url, output_path)
+            image_url = await generate_image_async({"prompt": prompt}, output_path, url_max_age=BRIA_URL_TTL)
             print(f"[generate_character_image] Saved: {output_path}")
             return {"url": image_url, "local_path": output_path}
             
@@ -127,11 +153,36 @@ def generate_character_image(name: str, description: str, video_id: str) -> dict
             print(f"[generate_character_image] Attempt {i+1} failed: {e}")
             if i == len(prompts) - 1:
                 raise
-            time.sleep(4)
+            FALLBACKS.inc(kind="character_prompt")
     
     raise ValueError("All prompt attempts failed")
 
 
+def generate_character_image(name: str, description: str, video_id: str, race: bool = None) -> dict:
+    """Generate a character reference image using Bria API."""
+    return run_sync(generate_character_image_async(name, description, video_id, race))
+
+
+def generate_character_images(characters: List[dict], video_id: str,
+                              race: bool = None) -> List[Union[dict, Exception]]:
+    """
+    Generate reference images for all characters concurrently.
+    
+    Returns one entry per character, in order: the result dict on success or
+    the exception that made it fail.
+    """
+    async def generate_all():
+        return await asyncio.gather(
+            *[
+                generate_character_image_async(c["name"], c["description"], video_id, race)
+                for c in characters
+            ],
+            return_exceptions=True
+        )
+    
+    return run_sync(generate_all())
+
+
 def text_to_image(prompt: str, video_id: str, scene_index: int) -> str:
     """Generate scene image from text using Bria API."""
     print(f"[text_to_image] Generating scene {scene_index}")
@@ -139,14 +190,8 @@ def text_to_image(prompt: str, video_id: str, scene_index: int) -> str:
     payload = {"prompt": prompt}
     
     try:
-        data = call_bria_api(payload)
-        image_url = data.get("url")
-        
-        if not image_url:
-            raise ValueError(f"No image URL in response: {data}")
-        
         output_path = str(OUTPUT_DIR / f"txt2img_{video_id}_{scene_index}.png")
-        save_image_from_url(image_url, output_path)
+        generate_image(payload, output_path)
         
         print(f"[text_to_image] Saved: {output_path}")
         return output_path
@@ -157,17 +202,23 @@ def text_to_image(prompt: str, video_id: str, scene_index: int) -> str:
 
 
 def image_to_image(prompt: str, character_urls: Dict[str, str], video_id: str, 
-                   scene_index: int, gemini_session) -> str:
-    """Generate scene image using character reference URLs via Bria API."""
+                   scene_index: int, gemini_session, selected_character: str = None) -> str:
+    """
+    Generate scene image using character reference URLs via Bria API.
+    
+    If selected_character is not given (or unknown), Gemini picks the
+    reference character for the scene.
+    """
     print(f"[image_to_image] Generating scene {scene_index} with characters: {list(character_urls.keys())}")
     
     char_list = list(character_urls.keys())
     
-    try:
-        selected_character = gemini_session.select_character_for_scene(prompt, char_list)
-        print(f"[image_to_image] Selected character: {selected_character}")
-    except:
-        selected_character = char_list[0] if char_list else None
+    if selected_character not in character_urls:
+        try:
+            selected_character = gemini_session.select_character_for_scene(prompt, char_list)
+            print(f"[image_to_image] Selected character: {selected_character}")
+        except:
+            selected_character = char_list[0] if char_list else None
     
     if selected_character and selected_character in character_urls:
         reference_url = character_urls[selected_character]
@@ -180,18 +231,13 @@ def image_to_image(prompt: str, character_urls: Dict[str, str], video_id: str,
         payload = {"prompt": prompt}
     
     try:
-        data = call_bria_api(payload)
-        image_url = data.get("url")
-        
-        if not image_url:
-            raise ValueError(f"No image URL in response: {data}")
-        
         output_path = str(OUTPUT_DIR / f"scene_i2i_{video_id}_{scene_index}.png")
-        save_image_from_url(image_url, output_path)
+        generate_image(payload, output_path)
         
         print(f"[image_to_image] Saved: {output_path}")
         return output_path
         
     except Exception as e:
+        FALLBACKS.inc(kind="image_to_text")
         print(f"[image_to_image] Error: {e}, falling back to text_to_image")
         return text_to_image(prompt, video_id, scene_index)
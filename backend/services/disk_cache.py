@@ -0,0 +1,176 @@
+"""Disk Cache - Content-addressed file cache with a size cap and LRU eviction."""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+from ..metrics import CACHE_REQUESTS, CACHE_SIZE, register_collector
+
+
+class DiskCache:
+    """
+    Content-addressed on-disk cache shared by all workers on a host.
+    
+    Entries are written to a temp file and renamed into place, so concurrent
+    processes never see partial files. Reads touch the entry's mtime, which
+    eviction uses as the LRU order once the cache grows past max_bytes.
+    With a ttl (seconds), entries older than that are treated as misses.
+    Lookups and size are exported to /metrics under name.
+    """
+    
+    def __init__(self, directory: Path, max_bytes: int, suffix: str = "",
+                 ttl: Optional[float] = None, name: Optional[str] = None):
+        self.directory = Path(directory)
+        self.name = name or self.directory.name
+        self.max_bytes = max_bytes
+        self.suffix = suffix
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._size: Optional[int] = None
+        self._lock = threading.Lock()
+        self.directory.mkdir(parents=True, exist_ok=True)
+        register_collector(self._collect_metrics)
+    
+    @staticmethod
+    def make_key(*parts) -> str:
+        """Hash JSON-serialisable parts into a stable cache key."""
+        blob = json.dumps(parts, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+        return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+    
+    def path_for(self, key: str) -> Path:
+        """Path of the data file for key."""
+        return self.directory / key[:2] / f"{key}{self.suffix}"
+    
+    def _meta_path(self, key: str) -> Path:
+        return self.directory / key[:2] / f"{key}.meta.json"
+    
+    def _count(self, hit: bool):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+        CACHE_REQUESTS.inc(cache=self.name, result="hit" if hit else "miss")
+    
+    def _collect_metrics(self):
+        with self._lock:
+            size = self._size
+        if size is not None:
+            CACHE_SIZE.set(size, cache=self.name)
+    
+    def get(self, key: str) -> Optional[Path]:
+        """Return the data path for key if cached, marking it recently used."""
+        path = self.path_for(key)
+        if self.ttl is not None and time.time() - self.get_meta(key).get("created_at", 0) > self.ttl:
+            self._count(False)
+            return None
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            self._count(False)
+            return None
+        self._count(True)
+        return path
+    
+    def get_file(self, key: str, dest_path: str) -> bool:
+        """Copy a cached entry to dest_path. Returns False on a miss."""
+        path = self.get(key)
+        if path is None:
+            return False
+        try:
+            shutil.copyfile(path, dest_path)
+        except FileNotFoundError:
+            # Evicted by another worker between lookup and copy
+            return False
+        return True
+    
+    def get_meta(self, key: str) -> dict:
+        """Return the metadata stored with key, or {}."""
+        try:
+            with open(self._meta_path(key), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+    
+    def _write_atomic(self, path: Path, write):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                write(f)
+            os.replace(temp_path, path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+    
+    def put(self, key: str, src_path: str = None, data: bytes = None,
+            meta: Optional[dict] = None) -> Path:
+        """Store a file (copied from src_path) or raw bytes under key."""
+        meta_blob = json.dumps({**(meta or {}), "created_at": time.time()}).encode("utf-8")
+        self._write_atomic(self._meta_path(key), lambda f: f.write(meta_blob))
+        
+        path = self.path_for(key)
+        if src_path is not None:
+            with open(src_path, "rb") as src:
+                self._write_atomic(path, lambda f: shutil.copyfileobj(src, f))
+        else:
+            self._write_atomic(path, lambda f: f.write(data))
+        
+        with self._lock:
+            if self._size is not None:
+                self._size += path.stat().st_size
+            over_cap = self._size is None or self._size > self.max_bytes
+        if over_cap:
+            self.evict()
+        return path
+    
+    def evict(self):
+        """Drop least recently used entries until the cache fits in max_bytes."""
+        entries = []
+        total = 0
+        for path in self.directory.glob(f"*/*{self.suffix}"):
+            if path.name.endswith((".meta.json", ".tmp")):
+                continue
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+        
+        if total > self.max_bytes:
+            # Evict down to 90% so we don't rescan on every put
+            target = int(self.max_bytes * 0.9)
+            for _, size, path in sorted(entries):
+                if total <= target:
+                    break
+                key = path.name[:len(path.name) - len(self.suffix)] if self.suffix else path.name
+                for victim in (path, self._meta_path(key)):
+                    try:
+                        victim.unlink()
+                    except FileNotFoundError:
+                        pass
+                total -= size
+            print(f"[DiskCache] Evicted {self.directory.name} down to {total} bytes")
+        
+        with self._lock:
+            self._size = total
+    
+    def stats(self) -> dict:
+        """Hit/miss counters for this process."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "size_bytes": self._size
+            }
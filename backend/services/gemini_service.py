@@ -1,14 +1,167 @@
 """Gemini AI Service - Chat session and content generation."""
 
-import re
 import json
-from typing import List
+import threading
+from typing import Callable, List, Optional
 from google import genai
+from google.genai import types
 
-from ..config import GEMINI_MODEL
+from ..config import (
+    GEMINI_MODEL, GEMINI_CACHE_ENABLED, GEMINI_CACHE_DIR, GEMINI_CACHE_TTL, GEMINI_CACHE_MAX_BYTES
+)
+from ..metrics import PROVIDER_SECONDS, FALLBACKS
+from .disk_cache import DiskCache
+from .rate_limiter import get_limiter
 
-# Initialize Gemini client
-gemini_client = genai.Client()
+_gemini_client = None
+_gemini_client_lock = threading.Lock()
+
+response_cache = DiskCache(
+    GEMINI_CACHE_DIR, GEMINI_CACHE_MAX_BYTES, suffix=".json", ttl=GEMINI_CACHE_TTL, name="gemini"
+)
+
+
+def get_gemini_client():
+    """Get the process-wide Gemini client, created on first use."""
+    global _gemini_client
+    with _gemini_client_lock:
+        if _gemini_client is None:
+            _gemini_client = genai.Client()
+    return _gemini_client
+
+
+def set_gemini_client(client):
+    """Replace the Gemini client, e.g. with a local stand-in."""
+    global _gemini_client
+    with _gemini_client_lock:
+        _gemini_client = client
+
+
+def call_gemini(method, *args, **kwargs):
+    """Call a Gemini client method under the shared Gemini rate limiter."""
+    limiter = get_limiter("gemini")
+    limiter.acquire()
+    try:
+        with PROVIDER_SECONDS.time(provider="gemini", operation=getattr(method, "__name__", "call")):
+            response = method(*args, **kwargs)
+    except Exception as e:
+        # google-genai APIError carries the HTTP status as .code
+        limiter.report(getattr(e, "code", None))
+        raise
+    limiter.report(200)
+    return response
+
+
+def _normalize(text: str) -> str:
+    return " ".join(text.split())
+
+
+def cached_response(kind: str, text: str, compute: Callable[[], object], use_cache: bool = True):
+    """
+    Return compute() for (model, kind, text), memoized in the response cache.
+    
+    Only used when GEMINI_CACHE_ENABLED; use_cache=False bypasses the lookup
+    but still stores the fresh result. None results are not cached.
+    """
+    if not GEMINI_CACHE_ENABLED:
+        return compute()
+    
+    key = DiskCache.make_key(GEMINI_MODEL, kind, _normalize(text))
+    if use_cache:
+        path = response_cache.get(key)
+        if path is not None:
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    print(f"[cached_response] Cache hit: {kind}")
+                    return json.load(f)
+            except (FileNotFoundError, ValueError):
+                pass
+    
+    value = compute()
+    if value is not None:
+        response_cache.put(key, data=json.dumps(value).encode("utf-8"))
+    return value
+
+# Response schema for the single-call story plan
+PLAN_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "characters": {
+            "type": "ARRAY",
+            "items": {
+                "type": "OBJECT",
+                "properties": {
+                    "name": {"type": "STRING"},
+                    "description": {"type": "STRING"},
+                },
+                "required": ["name", "description"],
+            },
+        },
+        "scenes": {
+            "type": "ARRAY",
+            "items": {
+                "type": "OBJECT",
+                "properties": {
+                    "description": {"type": "STRING"},
+                    "characters": {"type": "ARRAY", "items": {"type": "STRING"}},
+                    "narration": {"type": "STRING"},
+                    "image_prompt": {"type": "STRING"},
+                    "reference_character": {"type": "STRING", "nullable": True},
+                },
+                "required": ["description", "characters", "narration", "image_prompt"],
+            },
+        },
+    },
+    "required": ["characters", "scenes"],
+}
+
+
+def extract_json_array(text: str) -> Optional[list]:
+    """Return the first complete JSON array in text, or None."""
+    decoder = json.JSONDecoder()
+    start = text.find("[")
+    while start != -1:
+        try:
+            value, _ = decoder.raw_decode(text, start)
+            if isinstance(value, list):
+                return value
+        except ValueError:
+            pass
+        start = text.find("[", start + 1)
+    return None
+
+
+def validate_plan(data) -> dict:
+    """Check a story plan against what the pipeline needs and normalise it."""
+    if not isinstance(data, dict):
+        raise ValueError("Plan is not an object")
+    
+    characters = []
+    for char in data.get("characters") or []:
+        name = str(char.get("name", "")).strip()
+        if name and name not in [c["name"] for c in characters]:
+            characters.append({"name": name, "description": str(char.get("description", "")).strip()})
+    names = [c["name"] for c in characters]
+    
+    scenes = []
+    for scene in data.get("scenes") or []:
+        description = str(scene.get("description", "")).strip()
+        image_prompt = str(scene.get("image_prompt", "")).strip()
+        if not description or not image_prompt:
+            raise ValueError(f"Scene missing description or image prompt: {scene}")
+        scene_chars = [c for c in scene.get("characters") or [] if c in names]
+        reference = scene.get("reference_character")
+        scenes.append({
+            "description": description,
+            "characters": scene_chars,
+            "narration": str(scene.get("narration") or description).strip(),
+            "image_prompt": image_prompt,
+            "reference_character": reference if reference in scene_chars else (scene_chars[0] if scene_chars else None),
+        })
+    
+    if not scenes:
+        raise ValueError("Plan has no scenes")
+    return {"characters": characters, "scenes": scenes}
 
 
 class GeminiSession:
@@ -19,11 +172,13 @@ class GeminiSession:
         self.story = None
         self.characters = []
         self.scenes = []
+        # The chat history is shared, so concurrent scene workers take turns
+        self._lock = threading.Lock()
     
     def start_session(self, story: str):
         """Start a new chat session with the story context."""
         self.story = story
-        self.chat = gemini_client.chats.create(model=GEMINI_MODEL)
+        self.chat = get_gemini_client().chats.create(model=GEMINI_MODEL)
         
         init_prompt = f"""You are a video generation assistant. I will give you a story and ask you questions about it.
 Remember all details throughout our conversation.
@@ -33,15 +188,65 @@ STORY:
 
 Acknowledge you understand the story and are ready to help with video generation tasks."""
         
-        response = self.chat.send_message(init_prompt)
+        response = call_gemini(self.chat.send_message, init_prompt)
         print(f"[GeminiSession] Started: {response.text[:100]}...")
         return response.text
     
+    def plan(self, story: str, use_cache: bool = True) -> Optional[dict]:
+        """
+        Plan the whole video in one structured call.
+        
+        Returns {"characters": [...], "scenes": [...]} where each scene also
+        carries its image_prompt and reference_character, or None if the
+        response could not be validated (callers then use the chat flow).
+        """
+        self.story = story
+        plan = cached_response("plan", story, lambda: self._request_plan(story), use_cache)
+        if not plan:
+            return None
+        
+        self.characters = plan["characters"]
+        self.scenes = plan["scenes"]
+        print(f"[GeminiSession] Planned {len(self.characters)} characters, {len(self.scenes)} scenes")
+        return plan
+    
+    def _request_plan(self, story: str) -> Optional[dict]:
+        """Ask Gemini for a schema-constrained plan and validate it."""
+        prompt = f"""You are a video generation assistant. Plan a slideshow video for this story.
+
+STORY:
+{story}
+
+1. Identify all unique characters, with name and brief physical description.
+2. Break the story into 3-5 scenes. For each scene give:
+   - description: Short visual description (1-2 sentences)
+   - characters: Which characters appear (names from step 1)
+   - narration: Voiceover text
+   - image_prompt: SHORT image prompt (max 2 sentences), format: [subject], [action], [setting], [style], [lighting]
+   - reference_character: The ONE most prominent character in the scene, or null if none"""
+        
+        try:
+            response = call_gemini(
+                get_gemini_client().models.generate_content,
+                model=GEMINI_MODEL,
+                contents=prompt,
+                config=types.GenerateContentConfig(
+                    response_mime_type="application/json",
+                    response_schema=PLAN_SCHEMA
+                )
+            )
+            return validate_plan(json.loads(response.text))
+        except Exception as e:
+            FALLBACKS.inc(kind="plan_to_chat")
+            print(f"[GeminiSession] Structured plan failed, falling back to chat: {e}")
+            return None
+    
     def ask(self, prompt: str) -> str:
         """Send a message in the current session."""
         if not self.chat:
             raise ValueError("Session not started. Call start_session first.")
-        response = self.chat.send_message(prompt)
+        with self._lock:
+            response = call_gemini(self.chat.send_message, prompt)
         return response.text
     
     def identify_characters(self) -> List[dict]:
@@ -57,9 +262,9 @@ If no characters, return: []"""
         result = self.ask(prompt)
         
         try:
-            match = re.search(r'\[.*\]', result, re.DOTALL)
-            if match:
-                self.characters = json.loads(match.group())
+            characters = extract_json_array(result)
+            if characters is not None:
+                self.characters = characters
                 return self.characters
             return []
         except:
@@ -84,9 +289,9 @@ Return ONLY a JSON array:
         result = self.ask(prompt)
         
         try:
-            match = re.search(r'\[.*\]', result, re.DOTALL)
-            if match:
-                self.scenes = json.loads(match.group())
+            scenes = extract_json_array(result)
+            if scenes:
+                self.scenes = scenes
                 return self.scenes
             sentences = [s.strip() for s in self.story.split(".") if s.strip()]
             return [{"description": s, "characters": [], "narration": s} for s in sentences]
@@ -125,9 +330,14 @@ Which ONE character is most prominent? Return ONLY the name."""
         self.scenes = []
 
 
-def generate_story(context: str) -> str:
+def generate_story(context: str, use_cache: bool = True) -> str:
     """Generate a creative story from a prompt."""
-    response = gemini_client.models.generate_content(
+    return cached_response("story", context, lambda: _request_story(context), use_cache)
+
+
+def _request_story(context: str) -> str:
+    response = call_gemini(
+        get_gemini_client().models.generate_content,
         model=GEMINI_MODEL,
         contents=f"""Generate a creative story of max 200 words about: {context}
 
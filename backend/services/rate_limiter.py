@@ -0,0 +1,177 @@
+"""Rate Limiter - Adaptive token buckets for external APIs."""
+
+import asyncio
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional
+
+from ..config import (
+    BASE_DIR, RATE_LIMIT_SHARED, BRIA_RATE_PER_SEC, BRIA_BURST,
+    GEMINI_RATE_PER_SEC, GEMINI_BURST, TTS_RATE_PER_SEC, TTS_BURST
+)
+
+RATE_LIMIT_DB_PATH = BASE_DIR / "ratelimit.db"
+
+
+class RateLimiter:
+    """
+    Token bucket for one provider.
+    
+    The refill rate halves whenever the provider answers 429 or 5xx and
+    creeps back towards the configured rate on each success. With shared=True
+    the bucket lives in a small SQLite file so every worker process on the
+    host draws from the same budget; async callers then run the SQLite
+    calls on a thread so a contended lock never stalls their event loop.
+    """
+    
+    def __init__(self, name: str, rate: float, burst: float, shared: bool = False):
+        self.name = name
+        self.base_rate = rate
+        self.min_rate = rate / 16
+        self.burst = burst
+        self.shared = shared
+        self._lock = threading.Lock()
+        self._rate = rate
+        self._tokens = burst
+        self._updated = time.monotonic()
+        if shared:
+            conn = self._connect()
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS buckets (
+                    name TEXT PRIMARY KEY,
+                    tokens REAL NOT NULL,
+                    rate REAL NOT NULL,
+                    updated REAL NOT NULL
+                )
+            """)
+            conn.execute(
+                "INSERT OR IGNORE INTO buckets (name, tokens, rate, updated) VALUES (?, ?, ?, ?)",
+                (name, burst, rate, time.time())
+            )
+            conn.commit()
+            conn.close()
+    
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(str(RATE_LIMIT_DB_PATH), timeout=30, isolation_level=None)
+        return conn
+    
+    def _take_local(self) -> float:
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self._rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            return (1 - self._tokens) / self._rate
+    
+    def _take_shared(self) -> float:
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            tokens, rate, updated = conn.execute(
+                "SELECT tokens, rate, updated FROM buckets WHERE name = ?", (self.name,)
+            ).fetchone()
+            now = time.time()
+            # Remember the shared rate so report() can skip no-op writes
+            self._rate = rate
+            tokens = min(self.burst, tokens + max(0.0, now - updated) * rate)
+            wait = 0.0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / rate
+            conn.execute(
+                "UPDATE buckets SET tokens = ?, updated = ? WHERE name = ?",
+                (tokens, now, self.name)
+            )
+            conn.execute("COMMIT")
+            return wait
+        finally:
+            conn.close()
+    
+    def _take(self) -> float:
+        """Take a token if one is available; otherwise return how long to wait."""
+        return self._take_shared() if self.shared else self._take_local()
+    
+    def acquire(self):
+        """Block until a request may be sent."""
+        while True:
+            wait = self._take()
+            if not wait:
+                return
+            time.sleep(wait)
+    
+    async def acquire_async(self):
+        """Wait without blocking the event loop until a request may be sent."""
+        loop = asyncio.get_running_loop()
+        while True:
+            wait = await loop.run_in_executor(None, self._take_shared) if self.shared else self._take_local()
+            if not wait:
+                return
+            await asyncio.sleep(wait)
+    
+    def _set_rate(self, adjust):
+        if self.shared:
+            conn = self._connect()
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                (rate,) = conn.execute("SELECT rate FROM buckets WHERE name = ?", (self.name,)).fetchone()
+                new_rate = adjust(rate)
+                if new_rate != rate:
+                    conn.execute("UPDATE buckets SET rate = ? WHERE name = ?", (new_rate, self.name))
+                conn.execute("COMMIT")
+                self._rate = new_rate
+            finally:
+                conn.close()
+        else:
+            with self._lock:
+                self._rate = adjust(self._rate)
+    
+    def report(self, status_code: Optional[int]):
+        """Feed back a response status; 429/5xx slows the bucket down, success speeds it up."""
+        if status_code is not None and (status_code == 429 or status_code >= 500):
+            self._set_rate(lambda rate: max(self.min_rate, rate / 2))
+            print(f"[RateLimiter] {self.name}: backing off after HTTP {status_code}")
+        elif status_code is not None and status_code < 400:
+            # The common case: already at full speed, nothing to write
+            if self._rate >= self.base_rate:
+                return
+            self._set_rate(lambda rate: min(self.base_rate, rate + self.base_rate / 10))
+    
+    async def report_async(self, status_code: Optional[int]):
+        """report() for event-loop callers."""
+        if self.shared:
+            await asyncio.get_running_loop().run_in_executor(None, self.report, status_code)
+        else:
+            self.report(status_code)
+    
+    @property
+    def rate(self) -> float:
+        """Current refill rate in requests per second."""
+        if self.shared:
+            conn = self._connect()
+            try:
+                return conn.execute("SELECT rate FROM buckets WHERE name = ?", (self.name,)).fetchone()[0]
+            finally:
+                conn.close()
+        return self._rate
+
+
+_LIMITS = {
+    "bria": (BRIA_RATE_PER_SEC, BRIA_BURST),
+    "gemini": (GEMINI_RATE_PER_SEC, GEMINI_BURST),
+    "tts": (TTS_RATE_PER_SEC, TTS_BURST),
+}
+_limiters: Dict[str, RateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(provider: str) -> RateLimiter:
+    """Get the process-wide limiter for a provider ("bria", "gemini" or "tts")."""
+    with _limiters_lock:
+        if provider not in _limiters:
+            rate, burst = _LIMITS[provider]
+            _limiters[provider] = RateLimiter(provider, rate, burst, shared=RATE_LIMIT_SHARED)
+        return _limiters[provider]
@@ -0,0 +1,66 @@
+"""Thumbnail Service - Poster frames and scene preview strips."""
+
+from typing import List, Sequence
+
+import cv2
+import numpy as np
+
+from ..config import THUMBNAIL_FORMAT, THUMBNAIL_QUALITY
+from ..metrics import MEDIA_SECONDS
+
+
+def _encode_params() -> List[int]:
+    if THUMBNAIL_FORMAT == "webp":
+        return [cv2.IMWRITE_WEBP_QUALITY, THUMBNAIL_QUALITY]
+    return [cv2.IMWRITE_JPEG_QUALITY, THUMBNAIL_QUALITY, cv2.IMWRITE_JPEG_OPTIMIZE, 1]
+
+
+def _resize_to_width(image: np.ndarray, width: int) -> np.ndarray:
+    height, source_width = image.shape[:2]
+    if source_width <= width:
+        return image
+    # INTER_AREA avoids aliasing when shrinking
+    return cv2.resize(image, (width, max(1, round(height * width / source_width))), interpolation=cv2.INTER_AREA)
+
+
+def _write(path: str, image: np.ndarray):
+    if not cv2.imwrite(path, image, _encode_params()):
+        raise ValueError(f"Cannot write image: {path}")
+
+
+@MEDIA_SECONDS.time(operation="save_poster")
+def save_poster(image_path: str, output_path: str, width: int = 640) -> str:
+    """Save a downscaled, compressed copy of image_path as the video poster."""
+    image = cv2.imread(image_path)
+    if image is None:
+        raise ValueError(f"Cannot read image: {image_path}")
+    _write(output_path, _resize_to_width(image, width))
+    print(f"[save_poster] Created: {output_path}")
+    return output_path
+
+
+@MEDIA_SECONDS.time(operation="save_strip")
+def save_strip(image_paths: Sequence[str], output_path: str, width: int = 160) -> str:
+    """
+    Save one thumbnail per scene side by side in a single sprite image.
+    
+    Every tile is width pixels wide and has the height of the first scene's
+    thumbnail, so tile i starts at x = i * width.
+    """
+    tiles = []
+    for image_path in image_paths:
+        image = cv2.imread(image_path, cv2.IMREAD_REDUCED_COLOR_2)
+        if image is None:
+            print(f"[save_strip] Skipping unreadable image: {image_path}")
+            continue
+        tile = cv2.resize(image, (width, round(image.shape[0] * width / image.shape[1])),
+                          interpolation=cv2.INTER_AREA)
+        if tiles and tile.shape[0] != tiles[0].shape[0]:
+            tile = cv2.resize(tile, (width, tiles[0].shape[0]), interpolation=cv2.INTER_AREA)
+        tiles.append(tile)
+    
+    if not tiles:
+        raise ValueError("No images provided")
+    _write(output_path, cv2.hconcat(tiles))
+    print(f"[save_strip] Created: {output_path} ({len(tiles)} scenes)")
+    return output_path
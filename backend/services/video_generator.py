@@ -1,38 +1,62 @@
 """Video Generator - Main pipeline for video generation."""
 
 import os
-import time
+import threading
 import uuid
-from typing import Callable, Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional, Tuple
 
-from ..config import VIDEO_DIR
+from .. import database as db
+from .. import tracing
+from ..metrics import STAGE_SECONDS
+from ..config import (
+    GEMINI_PLANNING_MODE, VIDEO_DIR, SEGMENTED_RENDER, SEGMENT_ENCODE_WORKERS, SCENE_CONCURRENCY,
+    HLS_ENABLED, HLS_RENDITIONS, HLS_SEGMENT_SECONDS, THUMBNAIL_FORMAT, POSTER_WIDTH, STRIP_TILE_WIDTH
+)
 from .character_registry import CharacterRegistry
 from .gemini_service import GeminiSession, generate_story
-from .bria_service import generate_character_image, text_to_image, image_to_image
+from .bria_service import generate_character_images, text_to_image, image_to_image
+from .thumbnail_service import save_poster, save_strip
 from .audio_service import text_to_audio, get_audio_duration, merge_audio_files
-from .video_service import images_to_video, merge_video_audio, cleanup_files
+from .video_service import (
+    render_scenes, encode_scene_segment, concat_segments, probe_image_size, package_hls, cleanup_files
+)
 
 
 def generate_video_from_story(
     story: str, 
     video_id: str = None,
-    progress_callback: Optional[Callable[[float, str], None]] = None
+    progress_callback: Optional[Callable[[float, str], None]] = None,
+    segmented: Optional[bool] = None,
+    use_cache: bool = True
 ) -> str:
     """
     Generate video from a story.
     
+    Each stage's output is checkpointed under video_id, so calling this again
+    for a video that failed part-way skips finished stages and only
+    regenerates the missing scenes.
+    
     Args:
         story: The story text to generate video from
         video_id: Optional video ID (generated if not provided)
         progress_callback: Optional callback(progress: float, message: str)
+        segmented: Encode each scene as soon as it is ready and stream-copy
+            the segments together (defaults to SEGMENTED_RENDER)
+        use_cache: Reuse a cached Gemini plan for this story if one exists
     
     Returns:
         Path to the generated video file
     """
     if not video_id:
         video_id = str(uuid.uuid4())[:8]
+    if segmented is None:
+        segmented = SEGMENTED_RENDER
     character_registry = CharacterRegistry()
     gemini_session = GeminiSession()
+    checkpoints = db.get_checkpoints(video_id)
+    if checkpoints:
+        print(f"[Pipeline] Resuming {video_id} from checkpoints: {sorted(checkpoints)}")
     
     def update_progress(progress: float, message: str):
         if progress_callback:
@@ -44,46 +68,109 @@ def generate_video_from_story(
     print(f"Starting video generation: {video_id}")
     print(f"{'='*60}\n")
     
-    gemini_session.start_session(story)
+    encoder = ThreadPoolExecutor(max_workers=SEGMENT_ENCODE_WORKERS) if segmented else None
     
     try:
-        # Step 1: Identify characters
-        update_progress(0.1, "Identifying characters...")
-        characters = gemini_session.identify_characters()
+        # Step 1: Plan characters, scenes and image prompts in one call,
+        # falling back to the chat flow if that fails
+        update_progress(0.1, "Planning video...")
+        plan = checkpoints.get("plan")
+        if plan is None and GEMINI_PLANNING_MODE == "structured":
+            with STAGE_SECONDS.time(stage="plan"):
+                plan = gemini_session.plan(story, use_cache)
+            if plan:
+                db.save_checkpoint(video_id, "plan", plan)
+        
+        if plan:
+            characters = plan["characters"]
+        elif "characters" in checkpoints:
+            characters = checkpoints["characters"]
+        else:
+            update_progress(0.1, "Identifying characters...")
+            with STAGE_SECONDS.time(stage="characters"):
+                gemini_session.start_session(story)
+                characters = gemini_session.identify_characters()
+            db.save_checkpoint(video_id, "characters", characters)
         print(f"[Pipeline] Found {len(characters)} characters: {[c['name'] for c in characters]}")
         
-        # Step 2: Generate character images
-        if characters:
+        # Step 2: Generate all character images concurrently; the registry is
+        # fully populated before any scene work starts
+        portraits = {
+            name: portrait for name, portrait in checkpoints.get("portraits", {}).items()
+            if os.path.exists(portrait["local_path"])
+        }
+        missing = [c for c in characters if c["name"] not in portraits]
+        if missing:
             update_progress(0.2, "Generating character images...")
-            for i, char in enumerate(characters):
-                try:
-                    result = generate_character_image(char["name"], char["description"], video_id)
-                    character_registry.store(
-                        char["name"], 
-                        result["url"],
-                        result["local_path"],
-                        char["description"]
-                    )
-                    update_progress(0.2 + (0.15 * (i + 1) / len(characters)), f"Generated {char['name']}")
-                    time.sleep(2)
-                except Exception as e:
-                    print(f"[Pipeline] Failed to generate character {char['name']}: {e}")
+            with STAGE_SECONDS.time(stage="portraits"):
+                results = generate_character_images(missing, video_id)
+            for char, result in zip(missing, results):
+                if isinstance(result, Exception):
+                    print(f"[Pipeline] Failed to generate character {char['name']}: {result}")
+                    continue
+                portraits[char["name"]] = {**result, "description": char["description"]}
+            db.save_checkpoint(video_id, "portraits", portraits)
+        
+        for name, portrait in portraits.items():
+            character_registry.store(
+                name, 
+                portrait["url"],
+                portrait["local_path"],
+                portrait["description"]
+            )
+        if characters:
+            update_progress(0.35, f"Generated {len(character_registry.characters)} characters")
         
         # Step 3: Create scenes
-        update_progress(0.4, "Creating scenes...")
-        scenes = gemini_session.create_scenes()
+        if plan:
+            scenes = plan["scenes"]
+        elif "scenes" in checkpoints:
+            scenes = checkpoints["scenes"]
+        else:
+            update_progress(0.4, "Creating scenes...")
+            if not gemini_session.chat:
+                gemini_session.start_session(story)
+                gemini_session.characters = characters
+            with STAGE_SECONDS.time(stage="scene_plan"):
+                scenes = gemini_session.create_scenes()
+            db.save_checkpoint(video_id, "scenes", scenes)
         print(f"[Pipeline] Created {len(scenes)} scenes")
         
-        # Step 4: Process each scene
-        image_list = []
+        # Step 4: Process scenes on a bounded worker pool
+        segment_jobs = {}
+        frame_size = tuple(checkpoints["frame_size"]) if "frame_size" in checkpoints else None
+        frame_size_lock = threading.Lock()
+        progress_lock = threading.Lock()
+        completed = 0
         fps = 24
         
-        for i, scene in enumerate(scenes):
-            scene_progress = 0.4 + (0.4 * i / len(scenes))
-            update_progress(scene_progress, f"Processing scene {i+1}/{len(scenes)}...")
+        def encode_segment(i: int, image_path: str, audio_path: str, duration: float,
+                           segment_path: str):
+            encode_scene_segment(image_path, audio_path, duration, segment_path, fps, frame_size)
+            db.save_checkpoint(video_id, f"segment:{i}", segment_path)
+        
+        def process_scene(i: int, scene: dict) -> Optional[Tuple[str, str, float]]:
+            nonlocal frame_size, completed
+            tracing.annotate(scene=i)
+            done = checkpoints.get(f"scene:{i}")
+            if done and os.path.exists(done["image_path"]) and os.path.exists(done["audio_path"]):
+                with frame_size_lock:
+                    if encoder and frame_size is None:
+                        frame_size = probe_image_size(done["image_path"])
+                        db.save_checkpoint(video_id, "frame_size", frame_size)
+                segment_path = checkpoints.get(f"segment:{i}")
+                if encoder and segment_path and os.path.exists(segment_path):
+                    segment_jobs[i] = (segment_path, None)
+                elif encoder:
+                    segment_path = str(VIDEO_DIR / f"segment_{video_id}_{i}.mp4")
+                    segment_jobs[i] = (segment_path, encoder.submit(
+                        tracing.in_context(encode_segment), i, done["image_path"], done["audio_path"],
+                        done["duration"], segment_path
+                    ))
+                return done["image_path"], done["audio_path"], done["duration"]
             
             narration = scene.get("narration", scene.get("description", ""))
-            text_to_audio(narration, i, video_id)
+            audio_path = text_to_audio(narration, i, video_id)
             duration = get_audio_duration(i, video_id)
             
             description = scene.get("description", narration)
@@ -91,46 +178,131 @@ def generate_video_from_story(
             char_urls = character_registry.get_image_urls(scene_characters)
             
             try:
-                image_prompt = gemini_session.get_image_prompt(description)
+                image_prompt = scene.get("image_prompt") or gemini_session.get_image_prompt(description)
                 
                 if char_urls:
-                    image_path = image_to_image(image_prompt, char_urls, video_id, i, gemini_session)
+                    image_path = image_to_image(
+                        image_prompt, char_urls, video_id, i, gemini_session,
+                        selected_character=scene.get("reference_character")
+                    )
                 else:
                     image_path = text_to_image(image_prompt, video_id, i)
                 
-                frame_count = round(fps * duration)
-                image_list.extend([image_path] * frame_count)
-                print(f"[Pipeline] Scene {i}: {frame_count} frames, duration: {duration:.2f}s")
+                print(f"[Pipeline] Scene {i}: duration: {duration:.2f}s")
+                db.save_checkpoint(video_id, f"scene:{i}", {
+                    "image_path": image_path, "audio_path": audio_path, "duration": duration
+                })
+                
+                if encoder:
+                    # Encode in the background while other scenes are generated
+                    with frame_size_lock:
+                        if frame_size is None:
+                            frame_size = probe_image_size(image_path)
+                            db.save_checkpoint(video_id, "frame_size", frame_size)
+                    segment_path = str(VIDEO_DIR / f"segment_{video_id}_{i}.mp4")
+                    segment_jobs[i] = (segment_path, encoder.submit(
+                        tracing.in_context(encode_segment), i, image_path, audio_path, duration, segment_path
+                    ))
                 
             except Exception as e:
                 print(f"[Pipeline] Error in scene {i}: {e}")
-                continue
+                return None
             
-            time.sleep(2)
+            finally:
+                with progress_lock:
+                    completed += 1
+                    update_progress(
+                        0.4 + (0.4 * completed / len(scenes)),
+                        f"Processed scene {completed}/{len(scenes)}"
+                    )
+            
+            return image_path, audio_path, duration
         
-        if not image_list:
-            raise ValueError("No images generated")
+        pending = [i for i in range(len(scenes)) if f"scene:{i}" not in checkpoints]
+        if pending and not plan and not gemini_session.chat:
+            # Resumed chat-flow videos still need the session for image prompts
+            gemini_session.start_session(story)
+            gemini_session.characters = characters
         
-        # Step 5: Create video
-        update_progress(0.85, "Creating video...")
-        temp_video = str(VIDEO_DIR / f"temp_video_{video_id}.mp4")
-        images_to_video(image_list, temp_video, fps)
+        update_progress(0.4, f"Processing {len(scenes)} scenes...")
+        timed_scene = STAGE_SECONDS.time(stage="scene")(process_scene)
+        with STAGE_SECONDS.time(stage="scenes"):
+            with ThreadPoolExecutor(max_workers=SCENE_CONCURRENCY) as scene_pool:
+                futures = [
+                    scene_pool.submit(tracing.in_context(timed_scene), i, scene)
+                    for i, scene in enumerate(scenes)
+                ]
+                results = [future.result() for future in futures]
         
-        # Step 6: Merge audio
-        update_progress(0.9, "Adding audio...")
-        temp_audio = str(VIDEO_DIR / f"temp_audio_{video_id}.mp3")
-        merge_audio_files(video_id, temp_audio)
+        scene_results = [result for result in results if result]
+        if not scene_results:
+            raise ValueError("No images generated")
         
-        # Step 7: Final merge
-        update_progress(0.95, "Finalizing...")
         final_video = str(VIDEO_DIR / f"output_{video_id}.mp4")
-        merge_video_audio(temp_video, temp_audio, final_video)
+        temp_audio = None
+        
+        with STAGE_SECONDS.time(stage="finalize"):
+            if encoder:
+                # Step 5: Wait for the scene segments and join them without re-encoding
+                update_progress(0.9, "Finalizing...")
+                segment_paths = []
+                for i, (segment_path, future) in sorted(segment_jobs.items()):
+                    try:
+                        if future:
+                            future.result()
+                        segment_paths.append(segment_path)
+                    except Exception as e:
+                        print(f"[Pipeline] Error encoding scene {i}: {e}")
+                if not segment_paths:
+                    raise ValueError("No scene segments encoded")
+                concat_segments(segment_paths, final_video)
+            else:
+                # Step 5: Join the narration of the scenes that made it, without re-encoding
+                update_progress(0.85, "Adding audio...")
+                temp_audio = str(VIDEO_DIR / f"temp_audio_{video_id}.mp3")
+                merge_audio_files(video_id, temp_audio, [audio for _, audio, _ in scene_results])
+                
+                # Step 6: Render stills and narration straight to the final H.264 file
+                update_progress(0.9, "Creating video...")
+                scene_entries = [(image, duration) for image, _, duration in scene_results]
+                render_scenes(scene_entries, final_video, temp_audio, fps)
+        
+        if HLS_ENABLED:
+            # Step 7: Optional HLS ladder; the MP4 stays the canonical output if this fails
+            update_progress(0.95, "Packaging HLS...")
+            try:
+                package_hls(
+                    final_video, str(VIDEO_DIR / f"hls_{video_id}"), HLS_RENDITIONS,
+                    source_height=frame_size[1] if frame_size else None,
+                    segment_seconds=HLS_SEGMENT_SECONDS
+                )
+            except Exception as e:
+                print(f"[Pipeline] HLS packaging failed: {e}")
+        
+        # Progress updates are where a worker that lost its job lease stops;
+        # give it one before deleting files and checkpoints the new owner uses
+        update_progress(0.97, "Cleaning up...")
+        
+        # Poster and preview strip come from the scene images, before cleanup removes them
+        extension = "jpg" if THUMBNAIL_FORMAT == "jpeg" else THUMBNAIL_FORMAT
+        scene_images = [image for image, _, _ in scene_results]
+        try:
+            poster_path = save_poster(
+                scene_images[0], str(VIDEO_DIR / f"poster_{video_id}.{extension}"), POSTER_WIDTH
+            )
+            strip_path = save_strip(
+                scene_images, str(VIDEO_DIR / f"strip_{video_id}.{extension}"), STRIP_TILE_WIDTH
+            )
+            db.update_video_thumbnails(video_id, poster_path, strip_path)
+        except Exception as e:
+            print(f"[Pipeline] Thumbnail error: {e}")
         
         # Cleanup
         try:
-            os.remove(temp_video)
-            os.remove(temp_audio)
+            if temp_audio:
+                os.remove(temp_audio)
             cleanup_files(video_id)
+            db.delete_checkpoints(video_id)
         except Exception as e:
             print(f"[Pipeline] Cleanup error: {e}")
         
@@ -142,16 +314,26 @@ def generate_video_from_story(
         return final_video
         
     finally:
+        if encoder:
+            encoder.shutdown(wait=True)
         gemini_session.close()
 
 
-def generate_video_from_prompt(prompt: str, video_id: str = None, progress_callback: Optional[Callable] = None) -> str:
+def generate_video_from_prompt(prompt: str, video_id: str = None, progress_callback: Optional[Callable] = None,
+                               use_cache: bool = True) -> str:
     """Generate video from a prompt (generates story first)."""
-    if progress_callback:
-        progress_callback(0, "Generating story...")
+    if video_id:
+        story = db.get_checkpoints(video_id).get("story")
+    else:
+        video_id = str(uuid.uuid4())[:8]
+        story = None
     
-    story = generate_story(prompt)
-    print(f"[video_from_prompt] Generated story:\n{story}\n")
+    if story is None:
+        if progress_callback:
+            progress_callback(0, "Generating story...")
+        with STAGE_SECONDS.time(stage="story"):
+            story = generate_story(prompt, use_cache)
+        db.save_checkpoint(video_id, "story", story)
+        print(f"[video_from_prompt] Generated story:\n{story}\n")
     
-    time.sleep(2)
-    return generate_video_from_story(story, video_id, progress_callback)
+    return generate_video_from_story(story, video_id, progress_callback, use_cache=use_cache)
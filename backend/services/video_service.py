@@ -2,49 +2,232 @@
 
 import os
 import subprocess
-from typing import List
+import tempfile
+from typing import List, Optional, Sequence, Tuple
 import cv2
 
 from ..config import AUDIO_DIR, OUTPUT_DIR, VIDEO_DIR
+from ..metrics import MEDIA_SECONDS
 
 
-def images_to_video(image_list: List[str], video_path: str, fps: int = 24):
-    """Create video from list of image paths."""
-    if not image_list:
-        raise ValueError("No images provided")
-    
-    frame = cv2.imread(image_list[0])
+@MEDIA_SECONDS.time(operation="probe_image_size")
+def probe_image_size(image_path: str) -> Tuple[int, int]:
+    """Return (width, height) of an image, rounded down to even numbers for yuv420p."""
+    frame = cv2.imread(image_path)
     if frame is None:
-        raise ValueError(f"Cannot read image: {image_list[0]}")
-    
+        raise ValueError(f"Cannot read image: {image_path}")
     height, width, _ = frame.shape
-    video = cv2.VideoWriter(video_path, cv2.VideoWriter_fourcc(*'mp4v'), fps, (width, height))
+    return width - width % 2, height - height % 2
+
+
+def _concat_path(path: str) -> str:
+    """Quote a path for an ffmpeg concat list file."""
+    return "file '" + os.path.abspath(path).replace("'", "'\\''") + "'"
+
+
+def _run_ffmpeg(args: List[str]):
+    """Run ffmpeg with the given arguments, raising on failure."""
+    subprocess.run(["ffmpeg", "-y", "-hide_banner", "-loglevel", "error", *args], check=True)
+
+
+@MEDIA_SECONDS.time(operation="render_scenes")
+def render_scenes(
+    scenes: Sequence[Tuple[str, float]],
+    output_path: str,
+    audio_path: Optional[str] = None,
+    fps: int = 24,
+    size: Optional[Tuple[int, int]] = None
+):
+    """
+    Render still scenes to a browser-ready H.264 video in a single ffmpeg pass.
+    
+    Each scene image is decoded once and held on screen for its duration,
+    instead of being re-read for every output frame.
     
-    for img_path in image_list:
-        frame = cv2.imread(img_path)
-        if frame is not None:
-            video.write(frame)
+    Args:
+        scenes: List of (image_path, duration_seconds) entries, in order
+        output_path: Final .mp4 path
+        audio_path: Optional narration track, encoded straight to AAC
+        fps: Output frame rate
+        size: Output (width, height); defaults to the first image's size
+    """
+    if not scenes:
+        raise ValueError("No scenes provided")
     
-    video.release()
-    cv2.destroyAllWindows()
-    print(f"[images_to_video] Created: {video_path}")
+    width, height = size or probe_image_size(scenes[0][0])
+    
+    # Concat demuxer needs the last file repeated for its duration to be honoured
+    lines = []
+    for image_path, duration in scenes:
+        lines.append(_concat_path(image_path))
+        lines.append(f"duration {duration:.3f}")
+    lines.append(_concat_path(scenes[-1][0]))
+    
+    with tempfile.NamedTemporaryFile("w", suffix=".txt", delete=False) as f:
+        f.write("\n".join(lines) + "\n")
+        list_path = f.name
+    
+    args = ["-f", "concat", "-safe", "0", "-i", list_path]
+    if audio_path:
+        args += ["-i", audio_path]
+    args += [
+        "-vf", _video_filter(width, height, fps),
+        "-c:v", "libx264", "-preset", "fast", "-tune", "stillimage", "-crf", "23",
+    ]
+    if audio_path:
+        args += ["-c:a", "aac", "-b:a", "128k", "-shortest"]
+    # moov atom up front so browsers can start playback before the download finishes
+    args += ["-movflags", "+faststart", output_path]
+    
+    try:
+        _run_ffmpeg(args)
+    finally:
+        os.remove(list_path)
+    print(f"[render_scenes] Created: {output_path} ({len(scenes)} scenes)")
 
 
-def merge_video_audio(video_path: str, audio_path: str, output_path: str):
-    """Merge video and audio using ffmpeg with H.264 codec for browser compatibility."""
-    # Re-encode to H.264 (libx264) which is browser-compatible
-    command = (
-        f'ffmpeg -y -i "{video_path}" -i "{audio_path}" '
-        f'-c:v libx264 -preset fast -crf 23 -pix_fmt yuv420p '
-        f'-c:a aac -b:a 128k "{output_path}"'
+def _video_filter(width: int, height: int, fps: int) -> str:
+    """Scale/pad every still to the output frame so all scenes share one format."""
+    return (
+        f"scale={width}:{height}:force_original_aspect_ratio=decrease,"
+        f"pad={width}:{height}:(ow-iw)/2:(oh-ih)/2,fps={fps},format=yuv420p"
     )
-    subprocess.run(command, shell=True, check=True)
-    print(f"[merge_video_audio] Created: {output_path}")
+
+
+@MEDIA_SECONDS.time(operation="encode_scene_segment")
+def encode_scene_segment(
+    image_path: str,
+    audio_path: str,
+    duration: float,
+    output_path: str,
+    fps: int = 24,
+    size: Optional[Tuple[int, int]] = None
+):
+    """
+    Encode one scene (still image + narration) into a self-contained segment.
+    
+    All segments of a video must use the same size and fps so they can be
+    joined with concat_segments() without re-encoding.
+    
+    The still is fed at one frame per second and the fps filter repeats the
+    scaled frame, so the PNG is decoded and scaled once a second rather than
+    for every output frame.
+    """
+    width, height = size or probe_image_size(image_path)
+    _run_ffmpeg([
+        "-loop", "1", "-framerate", "1", "-i", image_path,
+        "-i", audio_path,
+        "-vf", _video_filter(width, height, fps),
+        "-c:v", "libx264", "-preset", "fast", "-tune", "stillimage", "-crf", "23",
+        "-c:a", "aac", "-b:a", "128k", "-ar", "44100", "-ac", "2",
+        "-t", f"{duration:.3f}",
+        output_path,
+    ])
+    print(f"[encode_scene_segment] Created: {output_path} ({duration:.2f}s)")
+
+
+@MEDIA_SECONDS.time(operation="concat_segments")
+def concat_segments(segment_paths: Sequence[str], output_path: str):
+    """Join pre-encoded scene segments with a stream copy (no re-encode)."""
+    if not segment_paths:
+        raise ValueError("No segments provided")
+    
+    with tempfile.NamedTemporaryFile("w", suffix=".txt", delete=False) as f:
+        f.write("\n".join(_concat_path(p) for p in segment_paths) + "\n")
+        list_path = f.name
+    
+    try:
+        _run_ffmpeg([
+            "-f", "concat", "-safe", "0", "-i", list_path,
+            "-c", "copy", "-movflags", "+faststart", output_path
+        ])
+    finally:
+        os.remove(list_path)
+    print(f"[concat_segments] Created: {output_path} ({len(segment_paths)} segments)")
+
+
+# Video bitrate per rendition height; other heights are scaled from the 720p rate
+HLS_BITRATES = {240: 400, 360: 800, 480: 1400, 720: 2800, 1080: 5000, 1440: 8000}
+
+
+@MEDIA_SECONDS.time(operation="probe_video_height")
+def probe_video_height(video_path: str) -> int:
+    """Return the frame height of a video file."""
+    capture = cv2.VideoCapture(video_path)
+    try:
+        height = int(capture.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    finally:
+        capture.release()
+    if not height:
+        raise ValueError(f"Cannot read video: {video_path}")
+    return height
+
+
+def hls_ladder(heights: Sequence[int], source_height: int) -> List[int]:
+    """Rendition heights to package: no upscaling, but always at least one rendition."""
+    ladder = sorted({h - h % 2 for h in heights if 0 < h <= source_height})
+    return ladder or [source_height - source_height % 2]
+
+
+@MEDIA_SECONDS.time(operation="package_hls")
+def package_hls(
+    input_path: str,
+    output_dir: str,
+    heights: Sequence[int],
+    source_height: Optional[int] = None,
+    segment_seconds: int = 4
+) -> str:
+    """
+    Package a finished MP4 as an HLS ladder in a single ffmpeg pass.
+    
+    The input is decoded once and split into one scaled H.264 rendition per
+    height; the audio track is shared. Key frames are forced on segment
+    boundaries so players can switch renditions cleanly.
+    
+    Returns:
+        Path to master.m3u8 inside output_dir
+    """
+    ladder = hls_ladder(heights, source_height or probe_video_height(input_path))
+    os.makedirs(output_dir, exist_ok=True)
+    
+    count = len(ladder)
+    filters = [f"[0:v]split={count}" + "".join(f"[v{i}]" for i in range(count))]
+    filters += [f"[v{i}]scale=-2:{height}[v{i}out]" for i, height in enumerate(ladder)]
+    
+    args = ["-i", input_path, "-filter_complex", ";".join(filters)]
+    for i, height in enumerate(ladder):
+        bitrate = HLS_BITRATES.get(height, HLS_BITRATES[720] * height // 720)
+        args += [
+            "-map", f"[v{i}out]",
+            f"-c:v:{i}", "libx264", f"-b:v:{i}", f"{bitrate}k",
+            f"-maxrate:v:{i}", f"{bitrate * 3 // 2}k", f"-bufsize:v:{i}", f"{bitrate * 2}k",
+        ]
+    for i in range(count):
+        args += ["-map", "0:a"]
+    args += [
+        "-preset", "fast", "-tune", "stillimage", "-pix_fmt", "yuv420p",
+        "-force_key_frames", f"expr:gte(t,n_forced*{segment_seconds})",
+        "-c:a", "aac", "-b:a", "128k", "-ac", "2",
+        "-f", "hls", "-hls_time", str(segment_seconds), "-hls_playlist_type", "vod",
+        "-hls_segment_filename", os.path.join(output_dir, "stream_%v_%03d.ts"),
+        "-master_pl_name", "master.m3u8",
+        "-var_stream_map", " ".join(f"v:{i},a:{i}" for i in range(count)),
+        os.path.join(output_dir, "stream_%v.m3u8"),
+    ]
+    _run_ffmpeg(args)
+    
+    master_path = os.path.join(output_dir, "master.m3u8")
+    print(f"[package_hls] Created: {master_path} ({', '.join(f'{h}p' for h in ladder)})")
+    return master_path
 
 
 def cleanup_files(video_id: str):
     """Clean up temporary files."""
-    for f in AUDIO_DIR.glob(f"audio_{video_id}_*.flac"):
+    for f in AUDIO_DIR.glob(f"audio_{video_id}_*.mp3"):
+        f.unlink()
+    for f in AUDIO_DIR.glob(f"audio_{video_id}_*.json"):
+        f.unlink()
+    for f in VIDEO_DIR.glob(f"segment_{video_id}_*.mp4"):
         f.unlink()
     
     for f in OUTPUT_DIR.glob(f"*_{video_id}_*.png"):
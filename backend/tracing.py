@@ -0,0 +1,193 @@
+"""
+Per-video trace timelines.
+
+process_video_generation opens a trace for each run. Spans opened while it
+is active form a tree through contextvars and are stored in the trace_spans
+table when the run ends. Every metrics timer (pipeline stages, provider
+calls, ffmpeg/OpenCV operations) opens a span, so the timeline matches
+/metrics without extra instrumentation.
+
+Context does not follow work into thread pools or onto the Bria event loop
+by itself: submit through in_context() and run coroutines through bind().
+"""
+
+import contextvars
+import itertools
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+_trace: contextvars.ContextVar[Optional["Trace"]] = contextvars.ContextVar("trace", default=None)
+_span: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("span", default=None)
+
+
+class Span:
+    """One timed operation in a trace."""
+    
+    __slots__ = ("span_id", "parent_id", "name", "start", "end", "status", "error", "thread", "attrs")
+    
+    def __init__(self, span_id: int, parent_id: Optional[int], name: str, attrs: dict):
+        self.span_id = span_id
+        self.parent_id = parent_id
+        self.name = name
+        self.start = time.time()
+        self.end = None
+        self.status = "running"
+        self.error = None
+        self.thread = threading.current_thread().name
+        self.attrs = attrs
+    
+    def to_dict(self) -> dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class Trace:
+    """The spans recorded for one pipeline run of a video."""
+    
+    def __init__(self, video_id: str):
+        self.video_id = video_id
+        self.trace_id = uuid.uuid4().hex[:8]
+        self.spans: List[Span] = []
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+    
+    def new_span(self, parent: Optional[Span], name: str, attrs: dict) -> Span:
+        with self._lock:
+            span = Span(next(self._ids), parent.span_id if parent else None, name, attrs)
+            self.spans.append(span)
+        return span
+
+
+def start_span(name: str, **attrs) -> Optional[tuple]:
+    """Open a child of the current span; returns a handle for end_span (None outside a trace)."""
+    trace = _trace.get()
+    if trace is None:
+        return None
+    span = trace.new_span(_span.get(), name, attrs)
+    return span, _span.set(span)
+
+
+def end_span(handle: Optional[tuple], error: Optional[BaseException] = None):
+    """Close a span opened with start_span."""
+    if handle is None:
+        return
+    span, token = handle
+    span.end = time.time()
+    span.status = "error" if error else "ok"
+    if error:
+        span.error = f"{type(error).__name__}: {error}"[:500]
+    try:
+        _span.reset(token)
+    except ValueError:
+        # Closed from a different context than it was opened in
+        _span.set(None)
+
+
+@contextmanager
+def span(name: str, **attrs):
+    """Record the enclosed block as a span of the current trace."""
+    handle = start_span(name, **attrs)
+    try:
+        yield
+    except BaseException as e:
+        end_span(handle, e)
+        raise
+    end_span(handle)
+
+
+def annotate(**attrs):
+    """Attach attributes to the current span."""
+    current = _span.get()
+    if current is not None and _trace.get() is not None:
+        current.attrs.update(attrs)
+
+
+@contextmanager
+def trace(video_id: str, **attrs):
+    """
+    Trace one pipeline run of video_id under a root "video" span.
+    
+    The spans are saved when the block exits, whether or not it raised.
+    """
+    run = Trace(video_id)
+    trace_token = _trace.set(run)
+    try:
+        with span("video", **attrs):
+            yield run
+    finally:
+        _trace.reset(trace_token)
+        try:
+            from . import database as db
+            db.save_trace_spans(video_id, run.trace_id, [s.to_dict() for s in run.spans])
+        except Exception as e:
+            print(f"[trace] Failed to save trace for {video_id}: {e}")
+
+
+def in_context(func):
+    """Bind func to a copy of the current context, for ThreadPoolExecutor.submit."""
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.run(func, *args, **kwargs)
+
+
+def bind(coro):
+    """Wrap coro so it runs under the current trace when scheduled on another loop/thread."""
+    trace_value, span_value = _trace.get(), _span.get()
+    
+    async def bound():
+        _trace.set(trace_value)
+        _span.set(span_value)
+        return await coro
+    
+    return bound()
+
+
+def build_tree(spans: List[dict]) -> List[dict]:
+    """Nest flat span rows under their parents (per trace run)."""
+    nodes: Dict[tuple, dict] = {}
+    roots = []
+    for s in spans:
+        nodes[(s["trace_id"], s["span_id"])] = {**s, "children": []}
+    for s in spans:
+        node = nodes[(s["trace_id"], s["span_id"])]
+        parent = nodes.get((s["trace_id"], s["parent_id"]))
+        if parent is not None:
+            parent["children"].append(node)
+        else:
+            roots.append(node)
+    return roots
+
+
+def to_chrome_trace(spans: List[dict]) -> dict:
+    """
+    Convert span rows to the Chrome trace event format.
+    
+    Load the result in chrome://tracing or ui.perfetto.dev. Each pipeline
+    run is a process and each worker thread a track.
+    """
+    events = []
+    pids: Dict[str, int] = {}
+    tids: Dict[tuple, int] = {}
+    for s in spans:
+        pid = pids.setdefault(s["trace_id"], len(pids) + 1)
+        if (pid, s["thread"]) not in tids:
+            tids[(pid, s["thread"])] = len(tids) + 1
+            events.append({
+                "ph": "M", "name": "thread_name", "pid": pid, "tid": tids[(pid, s["thread"])],
+                "args": {"name": s["thread"]}
+            })
+        end = s["end"] if s["end"] is not None else s["start"]
+        events.append({
+            "ph": "X",
+            "name": s["name"],
+            "cat": s["status"],
+            "pid": pid,
+            "tid": tids[(pid, s["thread"])],
+            "ts": int(s["start"] * 1e6),
+            "dur": int((end - s["start"]) * 1e6),
+            "args": {**(s["attrs"] or {}), "status": s["status"], "error": s["error"]},
+        })
+    for trace_id, pid in pids.items():
+        events.append({"ph": "M", "name": "process_name", "pid": pid, "args": {"name": f"run {trace_id}"}})
+    return {"traceEvents": events, "displayTimeUnit": "ms"}
@@ -0,0 +1,165 @@
+"""
+Video generation worker.
+
+Pulls jobs from the SQLite job queue and runs the generation pipeline,
+so long-running work happens outside the API process. Run one or more with:
+
+    python -m backend.worker
+"""
+
+import argparse
+import os
+import socket
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Optional
+
+from .config import JOB_LEASE_SECONDS, JOB_POLL_INTERVAL, JOB_MAX_ATTEMPTS, PIPELINE_WORKERS
+from . import database as db
+from . import tracing
+from .metrics import JOBS, JOBS_FINISHED, JOBS_IN_FLIGHT, register_collector, start_http_server
+from .progress import ProgressReporter
+
+# Runs jobs inside the API process when JOB_BACKEND is "background", kept
+# apart from the server's own threadpool so request handling isn't starved
+_local_executor = ThreadPoolExecutor(max_workers=PIPELINE_WORKERS, thread_name_prefix="pipeline")
+
+
+class LeaseLost(Exception):
+    """Another worker has taken over the job; stop without touching its outcome."""
+
+
+def process_video_generation(video_id: str, prompt: str, is_story: bool = False,
+                             use_cache: bool = True, webhook_url: Optional[str] = None,
+                             lease_lost: Optional[threading.Event] = None) -> bool:
+    """
+    Generate a video and record the outcome. Returns True on success.
+    
+    If lease_lost is set while the job runs, the pipeline stops at its next
+    progress update and neither the video status nor the webhook is written.
+    """
+    from .services.video_generator import generate_video_from_prompt, generate_video_from_story
+    db.save_checkpoint(video_id, "request", {
+        "prompt": prompt, "is_story": is_story, "use_cache": use_cache, "webhook_url": webhook_url
+    })
+    reporter = ProgressReporter(video_id, webhook_url)
+    
+    def progress(value: float, stage: str):
+        if lease_lost is not None and lease_lost.is_set():
+            raise LeaseLost(f"Lost lease on {video_id}")
+        reporter(value, stage)
+    
+    video_path = None
+    JOBS_IN_FLIGHT.inc()
+    try:
+        with tracing.trace(video_id, is_story=is_story, use_cache=use_cache):
+            if is_story:
+                video_path = generate_video_from_story(prompt, video_id, progress, use_cache=use_cache)
+            else:
+                video_path = generate_video_from_prompt(prompt, video_id, progress, use_cache=use_cache)
+        if lease_lost is not None and lease_lost.is_set():
+            raise LeaseLost(f"Lost lease on {video_id}")
+        db.update_video_status(video_id, "completed", video_path)
+        status = "completed"
+    except Exception as e:
+        if lease_lost is not None and lease_lost.is_set():
+            # The job now belongs to another worker, which records the outcome
+            print(f"[process_video_generation] Abandoning {video_id}: {e}")
+            status = "abandoned"
+        else:
+            print(f"[process_video_generation] Error: {e}")
+            db.update_video_status(video_id, "failed")
+            status = "failed"
+    finally:
+        JOBS_IN_FLIGHT.dec()
+    
+    JOBS_FINISHED.inc(status=status)
+    if status == "abandoned":
+        return False
+    reporter.finish(status, video_path)
+    return status == "completed"
+
+
+def _collect_job_counts():
+    for status, count in db.count_active_jobs().items():
+        JOBS.set(count, status=status)
+
+
+register_collector(_collect_job_counts)
+
+
+def run_in_process(video_id: str, job: dict) -> Future:
+    """Run a job on the in-process pipeline executor."""
+    return _local_executor.submit(process_video_generation, video_id, **job)
+
+
+def get_resume_job(video_id: str) -> Optional[dict]:
+    """Job arguments to resume a video from its checkpoints, or None if it can't be resumed."""
+    return db.get_checkpoints(video_id).get("request")
+
+
+def _heartbeat(job_id: int, worker_id: str, stop: threading.Event, lease_lost: threading.Event):
+    """Keep extending the job lease until stop is set; set lease_lost if it was taken away."""
+    while not stop.wait(JOB_LEASE_SECONDS / 3):
+        try:
+            if not db.heartbeat_job(job_id, worker_id, JOB_LEASE_SECONDS):
+                print(f"[worker] Lost lease on job {job_id}")
+                lease_lost.set()
+                return
+        except Exception as e:
+            print(f"[worker] Heartbeat failed for job {job_id}: {e}")
+
+
+def run_job(job: dict, worker_id: str):
+    """Run one claimed job while heartbeating its lease."""
+    stop = threading.Event()
+    lease_lost = threading.Event()
+    heartbeat = threading.Thread(target=_heartbeat, args=(job["id"], worker_id, stop, lease_lost), daemon=True)
+    heartbeat.start()
+    try:
+        print(f"[worker] Running job {job['id']} (video {job['video_id']}, attempt {job['attempts']})")
+        ok = process_video_generation(job["video_id"], **job["payload"], lease_lost=lease_lost)
+    finally:
+        stop.set()
+        heartbeat.join()
+    if lease_lost.is_set():
+        return
+    db.finish_job(job["id"], worker_id, "completed" if ok else "failed")
+
+
+def run_worker(once: bool = False):
+    """Claim and run jobs until interrupted (or until the queue is empty with once=True)."""
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+    print(f"[worker] Started {worker_id}")
+    
+    while True:
+        requeued = db.requeue_expired_jobs(JOB_MAX_ATTEMPTS)
+        if requeued:
+            print(f"[worker] Requeued {requeued} jobs with expired leases")
+        
+        job = db.claim_job(worker_id, JOB_LEASE_SECONDS)
+        if job is None:
+            if once:
+                return
+            time.sleep(JOB_POLL_INTERVAL)
+            continue
+        
+        run_job(job, worker_id)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a StillTale video generation worker")
+    parser.add_argument("--once", action="store_true", help="Exit when the queue is empty")
+    parser.add_argument("--metrics-port", type=int, help="Serve Prometheus metrics on this port")
+    args = parser.parse_args()
+    if args.metrics_port:
+        start_http_server(args.metrics_port)
+    try:
+        run_worker(once=args.once)
+    except KeyboardInterrupt:
+        print("[worker] Stopped")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,349 @@
+"""
+HTTP load test.
+
+Simulated users drive the real app in-process: each registers and logs in,
+then loops over a weighted mix of actions for the duration of the run:
+
+    generate  POST /generate-video
+    list      GET /my-videos, revalidating with If-None-Match like the frontend
+    download  GET /video/{id} with a Range header, for one of the user's finished videos
+    login     POST /auth/token (password hashing)
+    verify    GET /auth/verify (token and user lookup)
+
+Generation is stubbed: jobs report progress and write a file of
+--video-bytes without calling any external service, so the numbers reflect
+request handling (auth, SQLite, listing, file serving) rather than the
+pipeline. Stub jobs run on their own --job-workers executor, and each user
+starts with --seed-finished completed videos so downloads begin at once.
+
+    python -m benchmarks.load_test --users 50 --duration 30 --mix list=6,download=3,generate=1
+
+Reports throughput and p50/p95/p99 latency per route. Exits non-zero when
+--max-p99-ms is given and any route exceeds it, or when --max-error-rate
+is exceeded.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+# Point the app at a throwaway database before anything imports the config
+os.environ.setdefault("DB_PATH", os.path.join(tempfile.mkdtemp(prefix="stilltale-load-"), "load.db"))
+os.environ.setdefault("JOB_BACKEND", "background")
+
+import httpx  # noqa: E402
+
+from backend import database as db  # noqa: E402
+from backend import worker  # noqa: E402
+from backend.progress import ProgressReporter  # noqa: E402
+
+from .route_latency import percentile  # noqa: E402
+
+ACTIONS = ("generate", "list", "download", "login", "verify")
+ROUTES = {
+    "generate": "POST /generate-video",
+    "list": "GET /my-videos",
+    "download": "GET /video/{id} (range)",
+    "login": "POST /auth/token",
+    "verify": "GET /auth/verify",
+}
+
+
+def fake_generation(output_dir: str, job_seconds: float, video_bytes: int, steps: int = 5):
+    """Stand-in for process_video_generation: progress updates, then a video file of video_bytes."""
+    def run(video_id: str, prompt: str, is_story: bool = False, use_cache: bool = True,
+            webhook_url: str = None) -> bool:
+        reporter = ProgressReporter(video_id, webhook_url)
+        for step in range(steps):
+            time.sleep(job_seconds / steps)
+            reporter(step / steps, f"Step {step + 1}/{steps}")
+        video_path = write_video(output_dir, video_id, video_bytes)
+        db.update_video_status(video_id, "completed", video_path)
+        reporter.finish("completed", video_path)
+        return True
+    return run
+
+
+def write_video(output_dir: str, video_id: str, video_bytes: int) -> str:
+    video_path = os.path.join(output_dir, f"output_{video_id}.mp4")
+    with open(video_path, "wb") as f:
+        f.write(os.urandom(video_bytes))
+    return video_path
+
+
+def parse_mix(value: str) -> dict:
+    """Parse "list=6,download=3" into action weights; unknown actions are rejected."""
+    mix = {}
+    for part in value.split(","):
+        if not part.strip():
+            continue
+        action, _, weight = part.partition("=")
+        action = action.strip()
+        if action not in ACTIONS:
+            raise argparse.ArgumentTypeError(f"Unknown action {action!r}; choose from {', '.join(ACTIONS)}")
+        mix[action] = float(weight or 1)
+    if not any(mix.values()):
+        raise argparse.ArgumentTypeError("Mix needs at least one action with a positive weight")
+    return mix
+
+
+class Stats:
+    """Latencies and failures per route."""
+    
+    def __init__(self, routes=()):
+        # Routes the mix asks for are reported even if they never got a request
+        self.latencies = defaultdict(list, {route: [] for route in routes})
+        self.errors = defaultdict(int)
+        self.skipped = defaultdict(int)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+    
+    def record(self, route: str, seconds: float, status: int):
+        self.latencies[route].append(seconds)
+        self.statuses[route][status] += 1
+        if status >= 400:
+            self.errors[route] += 1
+    
+    def fail(self, route: str, seconds: float):
+        self.latencies[route].append(seconds)
+        self.statuses[route]["exception"] += 1
+        self.errors[route] += 1
+    
+    def skip(self, route: str):
+        """Count an action that had nothing to request, e.g. a download before any video finished."""
+        self.skipped[route] += 1
+    
+    def report(self, duration: float) -> dict:
+        """Print a per-route table and return it as a dict."""
+        rows = {}
+        print(
+            f"{'route':<28}{'count':>8}{'errors':>8}{'skipped':>9}{'req/s':>9}"
+            f"{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}"
+        )
+        for route, values in sorted(self.latencies.items()):
+            if not values:
+                rows[route] = {"count": 0, "errors": 0, "skipped": self.skipped[route], "rps": 0.0,
+                               "p50_ms": None, "p95_ms": None, "p99_ms": None, "max_ms": None, "statuses": {}}
+                print(f"{route:<28}{0:>8}{0:>8}{self.skipped[route]:>9}{0:>9.1f}  no requests")
+                continue
+            ms = [v * 1000 for v in values]
+            rows[route] = {
+                "count": len(ms),
+                "errors": self.errors[route],
+                "skipped": self.skipped[route],
+                "rps": len(ms) / duration,
+                "p50_ms": percentile(ms, 50),
+                "p95_ms": percentile(ms, 95),
+                "p99_ms": percentile(ms, 99),
+                "max_ms": max(ms),
+                "statuses": {str(k): v for k, v in self.statuses[route].items()},
+            }
+            row = rows[route]
+            print(
+                f"{route:<28}{row['count']:>8}{row['errors']:>8}{row['skipped']:>9}{row['rps']:>9.1f}"
+                f"{row['p50_ms']:>10.1f}{row['p95_ms']:>10.1f}{row['p99_ms']:>10.1f}{row['max_ms']:>10.1f}"
+            )
+        total = sum(row["count"] for row in rows.values())
+        errors = sum(row["errors"] for row in rows.values())
+        skipped = sum(row["skipped"] for row in rows.values())
+        print(f"{'total':<28}{total:>8}{errors:>8}{skipped:>9}{total / duration:>9.1f}")
+        return rows
+
+
+class User:
+    """One simulated client with its own token, ETag and videos."""
+    
+    def __init__(self, index: int, client: httpx.AsyncClient, stats: Stats, args, rng: random.Random):
+        self.username = f"load{os.getpid()}_{index}"
+        self.password = f"password{index}"
+        self.client = client
+        self.stats = stats
+        self.args = args
+        self.rng = rng
+        self.headers = {}
+        self.user_id = None
+        self.etag = None
+        self.pending = set()
+        self.finished = []
+    
+    async def request(self, route: str, method: str, url: str, **kwargs) -> httpx.Response:
+        start = time.perf_counter()
+        try:
+            response = await self.client.request(method, url, **kwargs)
+        except Exception as e:
+            self.stats.fail(route, time.perf_counter() - start)
+            print(f"[load_test] {route} raised: {e}")
+            return None
+        self.stats.record(route, time.perf_counter() - start, response.status_code)
+        return response
+    
+    async def start(self):
+        credentials = {"username": self.username, "password": self.password}
+        response = await self.request("POST /auth/register", "POST", "/auth/register", data=credentials)
+        if response is not None and response.status_code == 200:
+            self.headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+        await self.login()
+        user = db.get_user_by_username(self.username)
+        if user:
+            self.user_id = user["id"]
+            for i in range(self.args.seed_finished):
+                video_id = f"{self.user_id:05d}f{i:03d}"
+                db.create_video(video_id, self.user_id, f"finished video {i}")
+                db.update_video_status(
+                    video_id, "completed", write_video(self.args.output_dir, video_id, self.args.video_bytes)
+                )
+                self.finished.append(video_id)
+    
+    async def login(self):
+        response = await self.request(
+            ROUTES["login"], "POST", "/auth/token",
+            data={"username": self.username, "password": self.password}
+        )
+        if response is not None and response.status_code == 200:
+            self.headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    
+    async def generate(self):
+        response = await self.request(
+            ROUTES["generate"], "POST", "/generate-video",
+            json={"prompt": f"load test story from {self.username}", "is_story": True}, headers=self.headers
+        )
+        if response is not None and response.status_code == 200:
+            self.pending.add(response.json()["video_id"])
+    
+    async def list(self):
+        # The user's own videos, so the ones they started show up however busy the table is
+        headers = {"If-None-Match": self.etag} if self.etag else {}
+        response = await self.request(
+            ROUTES["list"], "GET", "/my-videos",
+            params={"limit": self.args.page_size, "owner_id": self.user_id}, headers=headers
+        )
+        if response is None or response.status_code != 200:
+            return
+        self.etag = response.headers.get("etag")
+        for video in response.json():
+            if video["video_id"] in self.pending and video["status"] == "completed":
+                self.pending.discard(video["video_id"])
+                self.finished.append(video["video_id"])
+    
+    async def download(self):
+        if not self.finished:
+            self.stats.skip(ROUTES["download"])
+            return
+        video_id = self.rng.choice(self.finished)
+        start = self.rng.randrange(0, max(1, self.args.video_bytes - self.args.range_bytes))
+        end = min(start + self.args.range_bytes, self.args.video_bytes) - 1
+        await self.request(
+            ROUTES["download"], "GET", f"/video/{video_id}",
+            headers={**self.headers, "Range": f"bytes={start}-{end}"}
+        )
+    
+    async def verify(self):
+        await self.request(ROUTES["verify"], "GET", "/auth/verify", headers=self.headers)
+    
+    async def run(self, mix: dict, deadline: float):
+        actions, weights = zip(*mix.items())
+        while time.perf_counter() < deadline:
+            action = self.rng.choices(actions, weights)[0]
+            await getattr(self, action)()
+            if self.args.think_time:
+                await asyncio.sleep(self.rng.expovariate(1 / self.args.think_time))
+
+
+async def run_load(args) -> tuple:
+    from app import app
+    
+    worker.process_video_generation = fake_generation(args.output_dir, args.job_seconds, args.video_bytes)
+    stats = Stats(ROUTES[action] for action, weight in args.mix.items() if weight > 0)
+    rng = random.Random(args.seed)
+    transport = httpx.ASGITransport(app=app)
+    
+    async with httpx.AsyncClient(transport=transport, base_url="http://load", timeout=120) as client:
+        if args.seed_videos:
+            user_id = db.create_user(f"seed{os.getpid()}", "x")
+            for i in range(args.seed_videos):
+                db.create_video(f"seed{i:06d}", user_id, f"seed video {i}")
+        
+        users = [User(i, client, stats, args, random.Random(rng.random())) for i in range(args.users)]
+        
+        # Users arrive over --ramp-up seconds rather than all at once
+        async def arrive(user: User, delay: float):
+            await asyncio.sleep(delay)
+            await user.start()
+        
+        await asyncio.gather(*[arrive(u, args.ramp_up * i / max(args.users, 1)) for i, u in enumerate(users)])
+        
+        start = time.perf_counter()
+        deadline = start + args.duration
+        await asyncio.gather(*[u.run(args.mix, deadline) for u in users])
+        elapsed = time.perf_counter() - start
+    
+    return stats, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the API with simulated users")
+    parser.add_argument("--users", type=int, default=20, help="Concurrent simulated users")
+    parser.add_argument("--duration", type=float, default=20.0, help="Seconds to run after every user has logged in")
+    parser.add_argument("--ramp-up", type=float, default=2.0, help="Seconds over which users register and log in")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix("list=6,download=3,generate=1,verify=1"),
+                        help=f"Action weights, e.g. list=6,download=3 (actions: {', '.join(ACTIONS)})")
+    parser.add_argument("--think-time", type=float, default=0.0, help="Mean seconds a user waits between requests")
+    parser.add_argument("--page-size", type=int, default=50, help="limit for /my-videos")
+    parser.add_argument("--job-seconds", type=float, default=2.0, help="Duration of each stubbed generation job")
+    parser.add_argument("--job-workers", type=int, default=16, help="Stubbed generation jobs run at once")
+    parser.add_argument("--seed-finished", type=int, default=2, help="Completed videos each user starts with")
+    parser.add_argument("--video-bytes", type=int, default=8 * 1024 * 1024, help="Size of each stubbed video")
+    parser.add_argument("--range-bytes", type=int, default=256 * 1024, help="Bytes fetched per range download")
+    parser.add_argument("--seed-videos", type=int, default=0, help="Videos inserted before the run")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the request mix")
+    parser.add_argument("--output", help="Write the per-route results as JSON")
+    parser.add_argument("--max-p99-ms", type=float, help="Fail if any route's p99 exceeds this")
+    parser.add_argument("--max-error-rate", type=float, help="Fail if more than this fraction of requests fail")
+    args = parser.parse_args()
+    
+    print(f"[load_test] Database: {os.environ['DB_PATH']}")
+    db.init_db()
+    args.output_dir = tempfile.mkdtemp(prefix="stilltale-load-videos-")
+    # Stub jobs get their own executor so the app's PIPELINE_WORKERS slots don't
+    # throttle how many videos finish; jobs still queued at the end are dropped
+    jobs = ThreadPoolExecutor(max_workers=args.job_workers, thread_name_prefix="load-job")
+    worker._local_executor = jobs
+    try:
+        stats, elapsed = asyncio.run(run_load(args))
+    finally:
+        jobs.shutdown(wait=True, cancel_futures=True)
+        shutil.rmtree(args.output_dir, ignore_errors=True)
+    
+    print(f"\n[load_test] {args.users} users for {elapsed:.1f}s, mix {args.mix}")
+    rows = stats.report(elapsed)
+    
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"users": args.users, "duration": elapsed, "mix": args.mix, "routes": rows}, f, indent=2)
+    
+    failed = False
+    if args.max_p99_ms is not None:
+        slow = {route: row["p99_ms"] for route, row in rows.items()
+                if row["p99_ms"] is not None and row["p99_ms"] > args.max_p99_ms}
+        if slow:
+            print(f"[load_test] p99 over {args.max_p99_ms} ms: {slow}")
+            failed = True
+    if args.max_error_rate is not None:
+        total = sum(row["count"] for row in rows.values())
+        errors = sum(row["errors"] for row in rows.values())
+        if total and errors / total > args.max_error_rate:
+            print(f"[load_test] Error rate {errors / total:.1%} over {args.max_error_rate:.1%}")
+            failed = True
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
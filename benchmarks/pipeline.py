@@ -0,0 +1,264 @@
+"""
+End-to-end pipeline benchmark.
+
+Runs generate_video_from_story against local stand-ins for Gemini, Bria and
+TTS (see benchmarks/providers.py), so the real scheduling, ffmpeg/OpenCV
+work, checkpointing and caching are measured without network calls or API
+keys. Each combination of story size and concurrency is run separately.
+
+    python -m benchmarks.pipeline --scenes 3,6 --concurrency 1,4 --videos 4
+    python -m benchmarks.pipeline --record recordings/   # real providers, saved
+    python -m benchmarks.pipeline --replay recordings/   # saved responses, offline
+
+Reports per-stage time, peak RSS and videos/hour. With --baseline, exits
+non-zero when videos/hour drops or a stage slows down by more than
+--max-regression compared to an earlier --output file.
+"""
+
+import argparse
+import json
+import os
+import resource
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from glob import glob
+
+# Point the pipeline at a throwaway database and caches and take the rate
+# limiters (and, without --cache, the caches) out of the measurement before
+# anything imports the config
+_scratch = tempfile.mkdtemp(prefix="stilltale-bench-")
+os.environ.setdefault("DB_PATH", os.path.join(_scratch, "bench.db"))
+for _provider in ("BRIA", "GEMINI", "TTS"):
+    os.environ.setdefault(f"{_provider}_RATE_PER_SEC", "1000")
+    os.environ.setdefault(f"{_provider}_BURST", "1000")
+for _cache in ("IMAGE", "TTS", "GEMINI"):
+    os.environ.setdefault(f"{_cache}_CACHE_DIR", os.path.join(_scratch, "cache", _cache.lower()))
+    if "--cache" not in sys.argv:
+        os.environ[f"{_cache}_CACHE_ENABLED"] = "false"
+
+from backend import database as db  # noqa: E402
+from backend.config import VIDEO_DIR  # noqa: E402
+from backend.metrics import STAGE_SECONDS, MEDIA_SECONDS, PROVIDER_SECONDS  # noqa: E402
+from backend.services.video_generator import generate_video_from_story  # noqa: E402
+
+from . import providers  # noqa: E402
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process since the last reset_peak_rss()."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # ru_maxrss is KiB on Linux, bytes on macOS, and cannot be reset
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+
+
+def reset_peak_rss():
+    """Restart peak RSS tracking (Linux only; elsewhere the peak covers the whole run)."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def children_peak_rss_mb() -> float:
+    """Largest peak RSS of any finished child process (ffmpeg)."""
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale
+
+
+def snapshot() -> dict:
+    """Total seconds per stage, media operation and provider call so far."""
+    totals = {}
+    for prefix, histogram in (("stage", STAGE_SECONDS), ("media", MEDIA_SECONDS), ("provider", PROVIDER_SECONDS)):
+        for key, (count, seconds) in histogram.totals().items():
+            # Drop the outcome label; errors are counted separately
+            *labels, outcome = key
+            name = ".".join([prefix, *labels])
+            entry = totals.setdefault(name, {"count": 0, "seconds": 0.0, "errors": 0})
+            entry["count"] += count
+            entry["seconds"] += seconds
+            if outcome == "error":
+                entry["errors"] += count
+    return totals
+
+
+def diff(after: dict, before: dict) -> dict:
+    result = {}
+    for name, entry in after.items():
+        prior = before.get(name, {"count": 0, "seconds": 0.0, "errors": 0})
+        count = entry["count"] - prior["count"]
+        if count:
+            result[name] = {
+                "count": count,
+                "seconds": entry["seconds"] - prior["seconds"],
+                "errors": entry["errors"] - prior["errors"],
+            }
+    return result
+
+
+def remove_outputs(video_id: str):
+    for path in glob(str(VIDEO_DIR / f"*_{video_id}.*")):
+        os.remove(path)
+    hls_dir = VIDEO_DIR / f"hls_{video_id}"
+    if hls_dir.is_dir():
+        for path in sorted(hls_dir.rglob("*"), reverse=True):
+            path.rmdir() if path.is_dir() else path.unlink()
+        hls_dir.rmdir()
+
+
+def run_case(scenes: int, concurrency: int, videos: int, characters: int, run: int) -> dict:
+    """Generate `videos` videos of `scenes` scenes, `concurrency` at a time."""
+    story = providers.fake_story(scenes, characters)
+    video_ids = [f"bench{run:02d}{i:04d}" for i in range(videos)]
+    
+    def generate(video_id: str) -> bool:
+        try:
+            generate_video_from_story(story, video_id)
+            return True
+        except Exception as e:
+            print(f"[pipeline] {video_id} failed: {e}")
+            return False
+    
+    before = snapshot()
+    reset_peak_rss()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(generate, video_ids))
+    wall = time.perf_counter() - start
+    
+    for video_id in video_ids:
+        remove_outputs(video_id)
+        db.delete_checkpoints(video_id)
+    
+    succeeded = sum(results)
+    return {
+        "scenes": scenes,
+        "concurrency": concurrency,
+        "videos": videos,
+        "succeeded": succeeded,
+        "wall_seconds": wall,
+        "videos_per_hour": succeeded / wall * 3600 if wall else 0.0,
+        "peak_rss_mb": peak_rss_mb(),
+        "children_peak_rss_mb": children_peak_rss_mb(),
+        "timings": diff(snapshot(), before),
+    }
+
+
+def report(case: dict):
+    print(
+        f"\n== {case['scenes']} scenes x {case['concurrency']} concurrent: "
+        f"{case['succeeded']}/{case['videos']} videos in {case['wall_seconds']:.1f}s, "
+        f"{case['videos_per_hour']:.0f} videos/hour, peak RSS {case['peak_rss_mb']:.0f} MB "
+        f"(ffmpeg {case['children_peak_rss_mb']:.0f} MB)"
+    )
+    print(f"{'operation':<40}{'count':>8}{'errors':>8}{'total s':>10}{'mean ms':>10}")
+    for name, entry in sorted(case["timings"].items()):
+        mean_ms = entry["seconds"] / entry["count"] * 1000
+        print(f"{name:<40}{entry['count']:>8}{entry['errors']:>8}{entry['seconds']:>10.2f}{mean_ms:>10.1f}")
+
+
+def regressions(cases: list, baseline: list, max_regression: float) -> list:
+    """Describe each case whose throughput or per-call stage time got worse than allowed."""
+    found = []
+    previous = {(c["scenes"], c["concurrency"]): c for c in baseline}
+    for case in cases:
+        old = previous.get((case["scenes"], case["concurrency"]))
+        if not old:
+            continue
+        label = f"{case['scenes']} scenes x {case['concurrency']}"
+        if case["videos_per_hour"] < old["videos_per_hour"] * (1 - max_regression):
+            found.append(f"{label}: {old['videos_per_hour']:.0f} -> {case['videos_per_hour']:.0f} videos/hour")
+        for name, entry in case["timings"].items():
+            if not name.startswith("stage.") or name not in old["timings"]:
+                continue
+            mean = entry["seconds"] / entry["count"]
+            old_mean = old["timings"][name]["seconds"] / old["timings"][name]["count"]
+            if mean > old_mean * (1 + max_regression):
+                found.append(f"{label}: {name} {old_mean * 1000:.0f} -> {mean * 1000:.0f} ms")
+    return found
+
+
+def int_list(value: str) -> list:
+    return [int(v) for v in value.split(",") if v.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the video pipeline against local provider stand-ins")
+    parser.add_argument("--scenes", type=int_list, default=[3, 6], help="Story sizes in scenes, comma-separated")
+    parser.add_argument("--concurrency", type=int_list, default=[1, 2], help="Videos generated at once, comma-separated")
+    parser.add_argument("--videos", type=int, default=2, help="Videos per case")
+    parser.add_argument("--characters", type=int, default=2, help="Characters in each story")
+    parser.add_argument("--gemini-latency", type=float, default=0.5, help="Seconds per Gemini call")
+    parser.add_argument("--gemini-failure-rate", type=float, default=0.0)
+    parser.add_argument("--bria-latency", type=float, default=0.2, help="Seconds per Bria HTTP request")
+    parser.add_argument("--bria-render-time", type=float, default=2.0, help="Seconds until a Bria image is ready")
+    parser.add_argument("--bria-failure-rate", type=float, default=0.0)
+    parser.add_argument("--image-size", default="1024x1024", help="Bria image size, WIDTHxHEIGHT")
+    parser.add_argument("--tts-latency", type=float, default=0.3, help="Seconds per TTS call")
+    parser.add_argument("--tts-failure-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0, help="Seed for latency jitter and failures")
+    parser.add_argument("--cache", action="store_true", help="Enable the image/TTS/Gemini caches (in a temp dir)")
+    parser.add_argument("--record", metavar="DIR", help="Call the real providers and save their responses")
+    parser.add_argument("--replay", metavar="DIR", help="Serve responses saved with --record")
+    parser.add_argument("--replay-speed", type=float, default=1.0, help="Scale recorded latencies (0 = none)")
+    parser.add_argument("--output", help="Write the results as JSON")
+    parser.add_argument("--baseline", help="Compare against a JSON file written with --output")
+    parser.add_argument("--max-regression", type=float, default=0.2,
+                        help="Allowed slowdown against the baseline, as a fraction")
+    args = parser.parse_args()
+    
+    db.init_db()
+    if args.record:
+        providers.install_recording(args.record)
+    elif args.replay:
+        providers.install_replay(args.replay, args.replay_speed)
+    else:
+        width, height = (int(v) for v in args.image_size.lower().split("x"))
+        providers.install_fakes(providers.FakeConfig(
+            gemini_latency=args.gemini_latency,
+            gemini_failure_rate=args.gemini_failure_rate,
+            bria_latency=args.bria_latency,
+            bria_render_time=args.bria_render_time,
+            bria_failure_rate=args.bria_failure_rate,
+            image_size=(width, height),
+            tts_latency=args.tts_latency,
+            tts_failure_rate=args.tts_failure_rate,
+            seed=args.seed,
+        ))
+    
+    print(f"[pipeline] Database: {os.environ['DB_PATH']}, caches: {os.path.dirname(os.environ['IMAGE_CACHE_DIR'])}")
+    cases = []
+    for scenes in args.scenes:
+        for concurrency in args.concurrency:
+            case = run_case(scenes, concurrency, args.videos, args.characters, len(cases))
+            report(case)
+            cases.append(case)
+    
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(cases, f, indent=2)
+    
+    if args.baseline:
+        with open(args.baseline) as f:
+            found = regressions(cases, json.load(f), args.max_regression)
+        if found:
+            print(f"[pipeline] Regressions over {args.max_regression:.0%}:")
+            for line in found:
+                print(f"  {line}")
+            sys.exit(1)
+    
+    if any(case["succeeded"] < case["videos"] for case in cases):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,414 @@
+"""
+Local stand-ins for Gemini, Bria and TTS.
+
+Fakes answer like the real services after a configurable delay, fail at a
+configurable rate and return images of a configurable size, so the
+pipeline can run offline. Recording wrappers capture real responses into a
+directory that the replay adapters serve back later.
+
+install_fakes() and install_recording() / install_replay() swap the
+providers in through the service modules' set_* hooks.
+"""
+
+import asyncio
+import base64
+import itertools
+import json
+import os
+import random
+import re
+import shutil
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+import httpx
+
+from backend.services import audio_service, bria_client, gemini_service
+from backend.services.disk_cache import DiskCache
+
+
+class FakeProviderError(Exception):
+    """Injected failure; .code mimics the HTTP status the real clients expose."""
+    
+    def __init__(self, provider: str, code: int = 503):
+        super().__init__(f"{provider}: injected failure")
+        self.code = code
+
+
+@dataclass
+class FakeConfig:
+    """Latencies in seconds, failure rates in [0, 1]."""
+    
+    gemini_latency: float = 0.5
+    gemini_failure_rate: float = 0.0
+    bria_latency: float = 0.2
+    bria_render_time: float = 2.0
+    bria_failure_rate: float = 0.0
+    image_size: tuple = (1024, 1024)
+    tts_latency: float = 0.3
+    tts_failure_rate: float = 0.0
+    words_per_second: float = 2.5
+    seed: int = 0
+
+
+def _jitter(seconds: float, rng: random.Random) -> float:
+    return max(0.0, seconds * rng.uniform(0.8, 1.2))
+
+
+# --- Gemini ---------------------------------------------------------------
+
+class _Response:
+    def __init__(self, text: str):
+        self.text = text
+
+
+def fake_story(scenes: int, characters: int) -> str:
+    """A deterministic story with the given number of scenes and named characters."""
+    names = [f"Character{i}" for i in range(max(characters, 1))]
+    sentences = [
+        f"{names[i % len(names)]} walks through a quiet village at dawn and finds something new in scene {i}"
+        for i in range(scenes)
+    ]
+    return ". ".join(sentences) + "."
+
+
+def _story_in(prompt: str) -> str:
+    """The story text the pipeline embeds after "STORY:" in its prompts."""
+    return prompt.split("STORY:", 1)[1].strip().split("\n\n", 1)[0]
+
+
+def fake_plan(story: str) -> dict:
+    """Build the plan Gemini would return for a fake_story()."""
+    names = sorted(set(re.findall(r"Character\d+", story)))
+    scenes = [s.strip() for s in story.split(".") if s.strip()]
+    return {
+        "characters": [{"name": n, "description": f"a cartoon person called {n}"} for n in names],
+        "scenes": [
+            {
+                "description": scene,
+                "characters": [n for n in names if n in scene],
+                "narration": scene,
+                "image_prompt": f"{scene}, storybook style, soft lighting",
+                "reference_character": next((n for n in names if n in scene), None),
+            }
+            for scene in scenes
+        ],
+    }
+
+
+class FakeGemini:
+    """Duck-types the parts of google.genai.Client the pipeline uses."""
+    
+    def __init__(self, config: FakeConfig):
+        self.config = config
+        self._rng = random.Random(config.seed)
+        self._lock = threading.Lock()
+        self.models = self
+        self.chats = self
+    
+    def _call(self):
+        with self._lock:
+            delay = _jitter(self.config.gemini_latency, self._rng)
+            failed = self._rng.random() < self.config.gemini_failure_rate
+        time.sleep(delay)
+        if failed:
+            raise FakeProviderError("gemini")
+    
+    def generate_content(self, model: str, contents: str, config=None) -> _Response:
+        self._call()
+        if "Plan a slideshow video" in contents:
+            return _Response(json.dumps(fake_plan(_story_in(contents))))
+        return _Response(fake_story(4, 2))
+    
+    def create(self, model: str) -> "FakeChat":
+        return FakeChat(self)
+
+
+class FakeChat:
+    def __init__(self, gemini: FakeGemini):
+        self.gemini = gemini
+        self.story = ""
+    
+    def send_message(self, prompt: str) -> _Response:
+        self.gemini._call()
+        if "STORY:" in prompt:
+            self.story = _story_in(prompt)
+            return _Response("Understood, ready to help.")
+        plan = fake_plan(self.story)
+        if "identify all unique characters" in prompt:
+            return _Response(json.dumps(plan["characters"]))
+        if "Break the story into" in prompt:
+            scenes = [{k: s[k] for k in ("description", "characters", "narration")} for s in plan["scenes"]]
+            return _Response(json.dumps(scenes))
+        if "Which ONE character" in prompt:
+            return _Response(re.findall(r"Character\d+", prompt.split("Available characters:", 1)[1])[0])
+        return _Response("A cartoon scene, storybook style, soft lighting")
+
+
+# --- Bria -----------------------------------------------------------------
+
+def fake_png(width: int, height: int, seed: int = 0) -> bytes:
+    """A PNG with enough detail to compress like an illustration."""
+    import cv2
+    import numpy as np
+    
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:height, 0:width]
+    image = np.stack([
+        (x * 255 // max(width - 1, 1)), (y * 255 // max(height - 1, 1)), ((x + y) * 127 // max(width + height, 1))
+    ], axis=-1).astype(np.uint8)
+    image = cv2.add(image, rng.integers(0, 24, image.shape, dtype=np.uint8))
+    ok, data = cv2.imencode(".png", image)
+    if not ok:
+        raise ValueError("Cannot encode PNG")
+    return data.tobytes()
+
+
+class FakeBria:
+    """httpx mock handler for the Bria submit, status and image endpoints."""
+    
+    def __init__(self, config: FakeConfig):
+        self.config = config
+        self._rng = random.Random(config.seed + 1)
+        self._ids = itertools.count(1)
+        self._ready_at = {}
+        self._image = fake_png(*config.image_size, seed=config.seed)
+    
+    async def __call__(self, request: httpx.Request) -> httpx.Response:
+        await asyncio.sleep(_jitter(self.config.bria_latency, self._rng))
+        path = request.url.path
+        
+        if request.method == "POST":
+            if self._rng.random() < self.config.bria_failure_rate:
+                return httpx.Response(503, json={"error": "injected failure"})
+            request_id = next(self._ids)
+            self._ready_at[request_id] = time.monotonic() + _jitter(self.config.bria_render_time, self._rng)
+            return httpx.Response(200, json={"status_url": f"http://bria.local/status/{request_id}"})
+        
+        if path.startswith("/status/"):
+            request_id = int(path.rsplit("/", 1)[1])
+            if time.monotonic() < self._ready_at.get(request_id, 0):
+                return httpx.Response(200, json={"status": "IN_PROGRESS"})
+            return httpx.Response(200, json={
+                "status": "COMPLETED", "result": {"image_url": f"http://bria.local/images/{request_id}.png"}
+            })
+        
+        if path.startswith("/images/"):
+            return httpx.Response(200, content=self._image, headers={"Content-Type": "image/png"})
+        
+        return httpx.Response(404)
+
+
+# --- TTS ------------------------------------------------------------------
+
+# MPEG-1 Layer III, 128 kbps, 44.1 kHz, joint stereo; 1152 samples per frame
+_MP3_HEADER = bytes([0xFF, 0xFB, 0x90, 0x44])
+_MP3_FRAME_BYTES = 144 * 128000 // 44100
+_MP3_FRAME_SECONDS = 1152 / 44100
+
+
+def silent_mp3(seconds: float) -> bytes:
+    """Frames of digital silence that both the MP3 parser and ffmpeg accept."""
+    frame = _MP3_HEADER + bytes(_MP3_FRAME_BYTES - len(_MP3_HEADER))
+    return frame * max(1, round(seconds / _MP3_FRAME_SECONDS))
+
+
+class FakeTTS:
+    """TTS engine writing silence as long as the text would take to read."""
+    
+    def __init__(self, config: FakeConfig):
+        self.config = config
+        self._rng = random.Random(config.seed + 2)
+        self._lock = threading.Lock()
+    
+    def __call__(self, text: str, output_path: str):
+        with self._lock:
+            delay = _jitter(self.config.tts_latency, self._rng)
+            failed = self._rng.random() < self.config.tts_failure_rate
+        time.sleep(delay)
+        if failed:
+            raise FakeProviderError("tts")
+        with open(output_path, "wb") as f:
+            f.write(silent_mp3(len(text.split()) / self.config.words_per_second))
+
+
+def install_fakes(config: FakeConfig):
+    """Route Gemini, Bria and TTS calls to the local fakes."""
+    gemini_service.set_gemini_client(FakeGemini(config))
+    bria_client.set_client(bria_client.BriaClient(
+        api_token="fake", api_url="http://bria.local/v2/image/generate",
+        transport=httpx.MockTransport(FakeBria(config))
+    ))
+    audio_service.set_tts_engine(FakeTTS(config), name="fake")
+
+
+# --- Record / replay ------------------------------------------------------
+
+class Recording:
+    """
+    Responses stored as files under directory/<provider>/<key>.
+    
+    Keys hash the request plus how many identical requests came before it,
+    so repeated polls of one status URL replay in order.
+    """
+    
+    def __init__(self, directory: str):
+        self.directory = Path(directory)
+        self._seen = {}
+        self._lock = threading.Lock()
+    
+    def key(self, provider: str, *parts) -> Path:
+        base = DiskCache.make_key(*parts)
+        with self._lock:
+            n = self._seen[base] = self._seen.get(base, -1) + 1
+        return self.directory / provider / f"{base}_{n}"
+    
+    def save(self, path: Path, entry: dict):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(f"{path}.json", "w", encoding="utf-8") as f:
+            json.dump(entry, f)
+    
+    def load(self, path: Path) -> Optional[dict]:
+        try:
+            with open(f"{path}.json", "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+    
+    def last(self, path: Path) -> Optional[dict]:
+        """Fallback when replay asks for more repeats than were recorded."""
+        stem, n = str(path).rsplit("_", 1)
+        for i in range(int(n) - 1, -1, -1):
+            entry = self.load(Path(f"{stem}_{i}"))
+            if entry is not None:
+                return entry
+        return None
+
+
+class _GeminiAdapter:
+    """Records a real Gemini client's responses, or replays them without it."""
+    
+    def __init__(self, recording: Recording, client=None, speed: float = 1.0):
+        self.recording = recording
+        self.client = client
+        self.speed = speed
+        self.models = self
+        self.chats = self
+    
+    def _respond(self, parts: tuple, call) -> _Response:
+        path = self.recording.key("gemini", *parts)
+        if self.client is not None:
+            start = time.perf_counter()
+            text = call().text
+            self.recording.save(path, {"text": text, "latency": time.perf_counter() - start})
+            return _Response(text)
+        entry = self.recording.load(path) or self.recording.last(path)
+        if entry is None:
+            raise KeyError(f"No recorded Gemini response for {parts[0]}")
+        time.sleep(entry["latency"] * self.speed)
+        return _Response(entry["text"])
+    
+    def generate_content(self, model: str, contents: str, config=None) -> _Response:
+        return self._respond(
+            ("generate_content", model, contents),
+            lambda: self.client.models.generate_content(model=model, contents=contents, config=config)
+        )
+    
+    def create(self, model: str) -> "_ChatAdapter":
+        return _ChatAdapter(self, self.client.chats.create(model=model) if self.client else None, model)
+
+
+class _ChatAdapter:
+    def __init__(self, adapter: _GeminiAdapter, chat, model: str):
+        self.adapter = adapter
+        self.chat = chat
+        self.history = [model]
+    
+    def send_message(self, prompt: str) -> _Response:
+        # Chat answers depend on the whole conversation so far
+        self.history.append(prompt)
+        return self.adapter._respond(("chat", *self.history), lambda: self.chat.send_message(prompt))
+
+
+class _BriaTransport(httpx.AsyncBaseTransport):
+    """Records real Bria HTTP exchanges, or replays them without the network."""
+    
+    def __init__(self, recording: Recording, record: bool, speed: float = 1.0):
+        self.recording = recording
+        self.upstream = httpx.AsyncHTTPTransport() if record else None
+        self.speed = speed
+    
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        body = await request.aread()
+        path = self.recording.key("bria", request.method, str(request.url), body.decode("utf-8", "replace"))
+        
+        if self.upstream is not None:
+            start = time.perf_counter()
+            response = await self.upstream.handle_async_request(request)
+            content = await response.aread()
+            self.recording.save(path, {
+                "status": response.status_code,
+                "content_type": response.headers.get("content-type", ""),
+                "retry_after": response.headers.get("retry-after"),
+                "body": base64.b64encode(content).decode("ascii"),
+                "latency": time.perf_counter() - start,
+            })
+            return httpx.Response(response.status_code, headers=response.headers, content=content)
+        
+        entry = self.recording.load(path) or self.recording.last(path)
+        if entry is None:
+            return httpx.Response(404, json={"error": f"not recorded: {request.method} {request.url}"})
+        await asyncio.sleep(entry["latency"] * self.speed)
+        headers = {"Content-Type": entry["content_type"]}
+        if entry.get("retry_after"):
+            headers["Retry-After"] = entry["retry_after"]
+        return httpx.Response(entry["status"], headers=headers, content=base64.b64decode(entry["body"]))
+    
+    async def aclose(self):
+        if self.upstream is not None:
+            await self.upstream.aclose()
+
+
+class _TTSAdapter:
+    """Records the real TTS engine's MP3s, or replays them."""
+    
+    def __init__(self, recording: Recording, engine=None, speed: float = 1.0):
+        self.recording = recording
+        self.engine = engine
+        self.speed = speed
+    
+    def __call__(self, text: str, output_path: str):
+        path = self.recording.key("tts", text)
+        if self.engine is not None:
+            start = time.perf_counter()
+            self.engine(text, output_path)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            shutil.copyfile(output_path, f"{path}.mp3")
+            self.recording.save(path, {"latency": time.perf_counter() - start})
+            return
+        entry = self.recording.load(path) or self.recording.last(path)
+        if entry is None or not os.path.exists(f"{path}.mp3"):
+            raise KeyError(f"No recorded TTS for: {text[:40]}")
+        time.sleep(entry["latency"] * self.speed)
+        shutil.copyfile(f"{path}.mp3", output_path)
+
+
+def install_recording(directory: str):
+    """Call the real providers and store every response under directory."""
+    recording = Recording(directory)
+    gemini_service.set_gemini_client(_GeminiAdapter(recording, gemini_service.get_gemini_client()))
+    bria_client.set_client(bria_client.BriaClient(transport=_BriaTransport(recording, record=True)))
+    audio_service.set_tts_engine(_TTSAdapter(recording, audio_service.gtts_engine), name="gtts")
+
+
+def install_replay(directory: str, speed: float = 1.0):
+    """Serve previously recorded responses; speed scales the recorded latencies (0 = instant)."""
+    recording = Recording(directory)
+    gemini_service.set_gemini_client(_GeminiAdapter(recording, speed=speed))
+    bria_client.set_client(bria_client.BriaClient(
+        api_token="replay", transport=_BriaTransport(recording, record=False, speed=speed)
+    ))
+    audio_service.set_tts_engine(_TTSAdapter(recording, speed=speed), name="replay")
@@ -0,0 +1,134 @@
+"""
+Route latency benchmark.
+
+Measures API request latency (p50/p95/p99) while video generation jobs are
+running in the same process, to catch handlers that block the event loop.
+Jobs are stand-ins that perform the pipeline's database writes, holding the
+SQLite write lock, without calling any external service.
+
+    python -m benchmarks.route_latency --jobs 4 --pollers 20 --duration 10
+
+Exits non-zero when --max-p99-ms is given and any route exceeds it.
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+# Point the app at a throwaway database before anything imports the config
+os.environ.setdefault("DB_PATH", os.path.join(tempfile.mkdtemp(prefix="stilltale-bench-"), "bench.db"))
+os.environ.setdefault("JOB_BACKEND", "background")
+
+import httpx  # noqa: E402
+
+from backend import database as db  # noqa: E402
+from backend import worker  # noqa: E402
+
+
+def percentile(values, pct: float) -> float:
+    """Nearest-rank percentile of a list of numbers."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def fake_generation(write_hold: float, steps: int):
+    """Stand-in for process_video_generation that only does the DB work."""
+    def run(video_id: str, prompt: str, is_story: bool = False, use_cache: bool = True) -> bool:
+        for step in range(steps):
+            conn = db.get_db()
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("UPDATE videos SET message = ? WHERE video_id = ?", (f"step {step}", video_id))
+            time.sleep(write_hold)
+            conn.commit()
+            db.save_checkpoint(video_id, f"scene:{step}", {"step": step})
+        db.update_video_status(video_id, "completed", f"/tmp/output_{video_id}.mp4")
+        return True
+    return run
+
+
+def report(latencies) -> dict:
+    """Print a per-route latency table and return the p99 values."""
+    p99s = {}
+    print(f"{'route':<28}{'count':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for route, values in sorted(latencies.items()):
+        ms = [v * 1000 for v in values]
+        p99s[route] = percentile(ms, 99)
+        print(
+            f"{route:<28}{len(ms):>8}{percentile(ms, 50):>10.1f}{percentile(ms, 95):>10.1f}"
+            f"{p99s[route]:>10.1f}{max(ms):>10.1f}"
+        )
+    return p99s
+
+
+async def run_benchmark(args) -> dict:
+    from app import app
+    
+    worker.process_video_generation = fake_generation(args.write_hold, args.job_steps)
+    latencies = defaultdict(list)
+    transport = httpx.ASGITransport(app=app)
+    
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+        response = await client.post("/auth/register", data={"username": f"bench{os.getpid()}", "password": "bench"})
+        response.raise_for_status()
+        headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+        
+        user_id = db.get_user_by_username(f"bench{os.getpid()}")["id"]
+        for i in range(args.seed_videos):
+            db.create_video(f"seed{i:06d}", user_id, f"seed video {i}")
+        
+        async def timed(route: str, method: str, url: str, **kwargs):
+            start = time.perf_counter()
+            response = await client.request(method, url, **kwargs)
+            latencies[route].append(time.perf_counter() - start)
+            return response
+        
+        deadline = time.perf_counter() + args.duration
+        
+        async def poller():
+            while time.perf_counter() < deadline:
+                await timed("GET /my-videos", "GET", "/my-videos", params={"limit": 50})
+                await timed("GET /auth/verify", "GET", "/auth/verify", headers=headers)
+        
+        async def submitter():
+            for _ in range(args.jobs):
+                await timed(
+                    "POST /generate-video", "POST", "/generate-video",
+                    json={"prompt": "a benchmark story", "is_story": True}, headers=headers
+                )
+                await asyncio.sleep(args.duration / max(args.jobs, 1))
+        
+        await asyncio.gather(submitter(), *[poller() for _ in range(args.pollers)])
+    
+    return report(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure route latency while generation jobs run")
+    parser.add_argument("--jobs", type=int, default=4, help="Generation jobs started during the run")
+    parser.add_argument("--job-steps", type=int, default=20, help="DB write steps per job")
+    parser.add_argument("--write-hold", type=float, default=0.05, help="Seconds each job step holds the write lock")
+    parser.add_argument("--pollers", type=int, default=20, help="Concurrent clients polling the API")
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds to run")
+    parser.add_argument("--seed-videos", type=int, default=1000, help="Videos inserted before the run")
+    parser.add_argument("--max-p99-ms", type=float, help="Fail if any route's p99 exceeds this")
+    args = parser.parse_args()
+    
+    print(f"[route_latency] Database: {os.environ['DB_PATH']}")
+    p99s = asyncio.run(run_benchmark(args))
+    
+    if args.max_p99_ms is not None:
+        slow = {route: p99 for route, p99 in p99s.items() if p99 > args.max_p99_ms}
+        if slow:
+            print(f"[route_latency] p99 over {args.max_p99_ms} ms: {slow}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -6,6 +6,10 @@ const getVideoUrl = (videoId) => {
   return `http://localhost:8000/public-video/${videoId}`;
 };
 
+const getPosterUrl = (video) => {
+  return video.poster_url ? `http://localhost:8000${video.poster_url}` : undefined;
+};
+
 const VideoModal = ({ video, onClose }) => {
   if (!video) return null;
 
@@ -32,6 +36,7 @@ const VideoModal = ({ video, onClose }) => {
         <div className="p-4">
           <video
             src={getVideoUrl(video.video_id)}
+            poster={getPosterUrl(video)}
             controls
             autoPlay
             className="w-full rounded-lg"
@@ -54,7 +59,7 @@ const VideoModal = ({ video, onClose }) => {
 };
 
 const PreviousVideos = () => {
-  const { videos, loading, fetchVideos } = useVideo();
+  const { videos, loading, loadingMore, hasMore, fetchVideos, loadMoreVideos } = useVideo();
   const [selectedVideo, setSelectedVideo] = useState(null);
 
   if (loading) {
@@ -110,6 +115,8 @@ const PreviousVideos = () => {
                     <>
                       <video
                         src={getVideoUrl(video.video_id)}
+                        poster={getPosterUrl(video)}
+                        preload={video.poster_url ? 'none' : 'metadata'}
                         className="w-full h-48 object-cover rounded-lg"
                         muted
                         onMouseEnter={(e) => e.target.play()}
@@ -128,6 +135,11 @@ const PreviousVideos = () => {
                     <div className="p-8 text-center h-48 flex flex-col items-center justify-center">
                       <Video className="w-12 h-12 text-white/40 mx-auto mb-2" />
                       <span className="text-white/60 text-sm capitalize">{video.status}</span>
+                      {video.status === 'processing' && video.stage && (
+                        <span className="text-white/40 text-xs mt-1">
+                          {Math.round((video.progress || 0) * 100)}% - {video.stage}
+                        </span>
+                      )}
                     </div>
                   )}
                 </div>
@@ -150,6 +162,19 @@ const PreviousVideos = () => {
             ))}
           </div>
         )}
+
+        {hasMore && (
+          <div className="text-center mt-8">
+            <button
+              onClick={loadMoreVideos}
+              disabled={loadingMore}
+              className="inline-flex items-center space-x-2 px-4 py-2 bg-primary-500/20 hover:bg-primary-500/30 text-primary-400 rounded-lg transition-all"
+            >
+              {loadingMore && <RefreshCw className="w-4 h-4 animate-spin" />}
+              <span>{loadingMore ? 'Loading...' : 'Load more'}</span>
+            </button>
+          </div>
+        )}
       </div>
 
       {/* Video Modal */}
@@ -14,6 +14,9 @@ export const useVideo = () => {
 export const VideoProvider = ({ children }) => {
   const [videos, setVideos] = useState([]);
   const [loading, setLoading] = useState(false);
+  const [loadingMore, setLoadingMore] = useState(false);
+  // Cursor for the next /my-videos page, or null when everything is loaded
+  const [nextCursor, setNextCursor] = useState(null);
   const [generating, setGenerating] = useState(false);
 
   const generateVideo = async (prompt, isStory = false) => {
@@ -31,6 +34,7 @@ export const VideoProvider = ({ children }) => {
       
       const newVideo = response.data;
       setVideos(prev => [newVideo, ...prev]);
+      watchProgress(newVideo.video_id);
       return { success: true, video: newVideo };
     } catch (error) {
       console.error('Video generation error:', error);
@@ -43,11 +47,27 @@ export const VideoProvider = ({ children }) => {
     }
   };
 
+  // Progress is pushed over Server-Sent Events instead of polling /my-videos
+  const watchProgress = (videoId) => {
+    const source = new EventSource(`http://localhost:8000/video/${videoId}/events`);
+    source.onmessage = (event) => {
+      const update = JSON.parse(event.data);
+      setVideos(prev => prev.map(v => (
+        v.video_id === videoId ? { ...v, ...update } : v
+      )));
+      if (update.status === 'completed' || update.status === 'failed') {
+        source.close();
+      }
+    };
+    source.onerror = () => source.close();
+  };
+
   const fetchVideos = async () => {
     setLoading(true);
     try {
       const response = await axios.get('http://localhost:8000/my-videos');
       setVideos(response.data);
+      setNextCursor(response.headers['x-next-cursor'] || null);
     } catch (error) {
       console.error('Fetch videos error:', error);
     } finally {
@@ -55,6 +75,25 @@ export const VideoProvider = ({ children }) => {
     }
   };
 
+  const loadMoreVideos = async () => {
+    if (!nextCursor || loadingMore) return;
+    setLoadingMore(true);
+    try {
+      const response = await axios.get('http://localhost:8000/my-videos', {
+        params: { cursor: nextCursor }
+      });
+      setVideos(prev => {
+        const seen = new Set(prev.map(v => v.video_id));
+        return [...prev, ...response.data.filter(v => !seen.has(v.video_id))];
+      });
+      setNextCursor(response.headers['x-next-cursor'] || null);
+    } catch (error) {
+      console.error('Load more videos error:', error);
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   useEffect(() => {
     // Fetch videos when component mounts (public - no auth needed)
     fetchVideos();
@@ -63,9 +102,12 @@ export const VideoProvider = ({ children }) => {
   const value = {
     videos,
     loading,
+    loadingMore,
+    hasMore: Boolean(nextCursor),
     generating,
     generateVideo,
-    fetchVideos
+    fetchVideos,
+    loadMoreVideos
   };
 
   return (
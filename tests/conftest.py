@@ -0,0 +1,5 @@
+import os
+import tempfile
+
+# backend.database creates its tables on import; keep that out of the repo's users.db
+os.environ.setdefault("DB_PATH", os.path.join(tempfile.mkdtemp(prefix="stilltale-test-"), "test.db"))
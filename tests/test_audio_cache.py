@@ -0,0 +1,46 @@
+import pytest
+
+pytest.importorskip("gtts")
+
+from backend.services import audio_service
+from backend.services.disk_cache import DiskCache
+
+# MPEG-1 Layer III, 128 kbps, 44.1 kHz: 417-byte frames of 1152 samples
+_FRAME = bytes([0xFF, 0xFB, 0x90, 0x44]) + bytes(144 * 128000 // 44100 - 4)
+
+
+@pytest.fixture
+def engine(tmp_path, monkeypatch):
+    calls = []
+    
+    def silent(text, output_path):
+        calls.append(text)
+        with open(output_path, "wb") as f:
+            f.write(_FRAME * 100)
+    
+    monkeypatch.setattr(audio_service, "AUDIO_DIR", tmp_path)
+    monkeypatch.setattr(audio_service, "TTS_CACHE_ENABLED", True)
+    monkeypatch.setattr(audio_service, "tts_cache", DiskCache(tmp_path / "cache", 10**6, suffix=".mp3"))
+    monkeypatch.setattr(audio_service, "get_limiter", lambda name: _NoLimit())
+    monkeypatch.setattr(audio_service, "_tts_engine", silent)
+    monkeypatch.setattr(audio_service, "_tts_engine_name", "silent")
+    return calls
+
+
+class _NoLimit:
+    def acquire(self):
+        pass
+    
+    def report(self, status_code):
+        pass
+
+
+def test_cache_hit_without_meta_reads_duration_from_clip(engine, tmp_path):
+    duration = audio_service.synthesize_cached("hello there", str(tmp_path / "a.mp3"))
+    assert duration == pytest.approx(100 * 1152 / 44100, rel=0.01)
+    
+    key = DiskCache.make_key("silent", audio_service.TTS_LANGUAGE, audio_service.TTS_TLD, "hello there")
+    audio_service.tts_cache._meta_path(key).unlink()
+    
+    assert audio_service.synthesize_cached("hello there", str(tmp_path / "b.mp3")) == pytest.approx(duration)
+    assert engine == ["hello there"]
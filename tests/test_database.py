@@ -0,0 +1,35 @@
+import sqlite3
+
+import pytest
+
+from backend import database as db
+
+
+@pytest.fixture
+def conn(tmp_path, monkeypatch):
+    monkeypatch.setattr(db, "DB_PATH", tmp_path / "test.db")
+    db.close_db()
+    db.init_db()
+    yield db.get_db()
+    db.close_db()
+
+
+def test_failed_write_does_not_leave_a_stale_transaction(conn, tmp_path):
+    user_id = db.create_user("alice", "hash")
+    db.create_video("vid1", user_id, "a prompt")
+    assert db.get_video_by_id("vid1")["status"] == "processing"
+    
+    other = sqlite3.connect(str(tmp_path / "test.db"), isolation_level=None)
+    other.execute("BEGIN IMMEDIATE")
+    conn.execute("PRAGMA busy_timeout=50")
+    try:
+        with pytest.raises(sqlite3.OperationalError, match="locked"):
+            db.update_video_status("vid1", "completed", "/tmp/vid1.mp4")
+        assert not conn.in_transaction
+        
+        other.execute("UPDATE videos SET status = 'failed' WHERE video_id = 'vid1'")
+        other.execute("COMMIT")
+    finally:
+        other.close()
+    
+    assert db.get_video_by_id("vid1")["status"] == "failed"
@@ -0,0 +1,12 @@
+"""
+AI Video Generator - Worker
+
+Runs queued video generation jobs outside the API process.
+Start the API with JOB_BACKEND=queue and run one or more workers.
+"""
+
+from backend.worker import main
+
+
+if __name__ == "__main__":
+    main()